@@ -4,6 +4,45 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <string.h>
+#include <stdint.h>
+#include <time.h>
+#include <pthread.h>
+
+// Flags that select the search strategy used by backtracking_search
+#define MRV_ORDERING 1 // Dynamic minimum remaining values variable ordering
+#define FORWARD_CHECKING 2 // Prune the domains of unassigned variables after each assignment
+#define BRANCH_AND_BOUND 4 // Prune branches whose lower bound cannot beat the best assignment
+#define STUDENT_FLOW 8 // Search over the leaders only and place the students with a min cost flow
+#define LOCAL_SEARCH 16 // Stop at the first solution and improve it by simulated annealing
+#define SYMMETRY_BREAKING 32 // Search only one of each set of interchangeable leaders and sections
+#define BACKJUMPING 64 // Jump back to the cause of a dead end instead of the previous variable
+#define NOGOOD_LEARNING 128 // With BACKJUMPING remember short nogoods and reject them on other branches
+#define RANDOM_RESTARTS 256 // Restart the search with shuffled values on a Luby schedule of node limits
+#define LEAST_LOADED 512 // Try the sections with the fewest students first, in domain order on ties
+
+// How many search nodes are expanded between looks at the clock
+#define NODES_PER_CHECK 256
+
+// The node limit of a restart is this times a term of the Luby sequence
+#define RESTART_NODES 512
+
+// Each stage of a repair gets at most this fraction of the time left (see repair.c)
+#define REPAIR_SHARE 4
+
+// Courses with at most this many times keep each domain in a single word
+#define BITSET_TIMES 64
+
+// The longest nogood worth remembering and how many are remembered at once
+#define NOGOOD_SIZE 4
+#define NOGOOD_CACHE 4096
+
+// Slack used when comparing costs against each other
+#define COST_EPSILON 1e-9
+
+// The weights of the cost terms when the caller gives none (see struct weights)
+#define SIZE_WEIGHT 2.0
+#define GENDER_WEIGHT 1.0
+#define PREFERENCE_WEIGHT 0.0
 
 // A structure for storing a domain
 struct domain{
@@ -11,6 +50,42 @@ struct domain{
     int * values;
 };
 
+// The weights of the terms of the cost (see cost in backtracking.c). None
+// of them may be negative.
+struct weights{
+    double size; // Squared differences of the section sizes from the mean size
+    double gender; // Squared differences of men and women in each section
+    double preference; // How far down their preferences each section is
+};
+
+// The data describing a problem, as passed to assign_students
+struct problem{
+    struct domain * D; // The domain of every variable
+    int total; // leaders + students
+    int leaders; // The number of section leaders
+    int times; // Number of potential section times
+    int * genders; // A table giving the genders of the students
+    struct domain * bin_constraints; // The binary constraints
+    struct weights * weights; // The weights of the cost terms
+    int * rank; // Preference ranks (see preference_ranks), NULL if they do not count
+    int * hint; // The section each variable tries first, -1 for none, or NULL
+};
+
+// Called with each improved assignment, its length and its cost
+typedef void (*solution_callback)(int * assignment, int total, double cost);
+
+// The best assignment found so far, shared between searches running at once
+struct incumbent{
+    int total; // The number of variables in result
+    int * result; // The best assignment found
+    double cost; // Its cost, DBL_MAX until one is found
+    int found; // Whether any assignment has been found
+    int done; // Set once the search should stop
+    long long deadline; // When the search should stop, see monotonic_milliseconds
+    solution_callback on_improve; // Told about every improvement, may be NULL
+    pthread_mutex_t lock; // Guards result, cost and found and serializes on_improve
+};
+
 // A structure for storing the assignment
 struct assignment{
     int total; // leaders + students
@@ -19,13 +94,41 @@ struct assignment{
     int * genders; // A table giving the genders of the students;
     int * female_count; // A table the counts the number of women in each section
     struct domain * bin_constraints; // The binary constraints
+    struct weights * weights; // The weights of the cost terms
+    int * rank; // rank[var * times + section] is how far down var's preferences section is, or NULL
+    int * hint; // The section each variable tries first, -1 for none, or NULL
 
     int * section_assignments; // The actual section assignents
     int times; // Number of potential section times
     int students_assigned;
     int leaders_assigned;
+    int female_students; // The number of women among the students
+    int female_students_assigned; // The number of those women that have a section
     int * has_leader; // Array of indicating which sections have leaders
     int * student_count; // The number of students in each section
+    int * section_leader; // The leader of each section, -1 if it has none
+
+    // Bitsets of leaders and of section times, one row of words per variable
+    int leader_words; // Words in each row of cant_be_with
+    uint64_t * cant_be_with; // The leaders each student cannot be with
+    int section_words; // Words in each row of forbidden_sections
+    uint64_t * forbidden_sections; // Sections each student can never be in (NULL until computed)
+
+    // Interchangeable leaders and sections (see symmetry.c), NULL until computed
+    int * leader_before; // The previous leader each leader is interchangeable with, or -1
+    int * leader_after; // The next leader each leader is interchangeable with, or -1
+    int * section_before; // The previous section each section is interchangeable with, or -1
+
+    // Running cost terms kept up to date by set_section (see update_section_cost)
+    long long size_error; // Squared section size errors, scaled by leaders^2
+    long long excess_error; // The part of size_error from sections above the mean size
+    long long gender_error; // Gender costs of the sections with leaders
+    long long preference_error; // Preference ranks of the assigned sections
+
+    // Counts behind the inconsistency flags (see update_section_counts)
+    int empty_sections; // Sections with a leader and no students
+    int crowded_sections; // Sections with more than one leader
+    int unled_students; // Students in sections without a leader
 
     // Flags for different inconsistencies
     short section_has_more_than_one_leader;
@@ -33,10 +136,60 @@ struct assignment{
     short student_in_section_with_no_leader;
 };
 
+// The current domains of the variables while searching with forward checking
+struct domain_state{
+    int total; // leaders + students
+    int leaders; // The number of section leaders
+    int times; // Number of potential section times
+    uint64_t * masks; // Bitset domain of each variable when times <= BITSET_TIMES, otherwise NULL
+    char * live; // Otherwise live[var * times + section] is 1 while section is in the domain of var
+    int * size; // and the number of live values of each variable
+    int * leader_support; // The number of leaders that could still take each section
+    int * student_support; // The number of students that could still attend each section
+
+    int * trail; // Stack of (var, section) pairs removed from the domains
+    int trail_size;
+    int * pending; // Queue of sections that ran out of leaders or students
+    int pending_size;
+
+    int * excluded_start; // Offsets into excluded for each leader
+    int * excluded; // The students that cannot be with each leader
+
+    int * leader_before; // Interchangeable leaders, shared with the assignment
+    int * leader_after; // and NULL without SYMMETRY_BREAKING
+
+    // Why each value was removed, for BACKJUMPING (see backjumping.c)
+    int depth; // The depth of the search being propagated, -1 before the search starts
+    int indirect; // Whether removals are being made by propagate_pending
+    int wiped; // The variable whose domain the last failed propagation wiped out
+    int * removed_at; // removed_at[var * times + section] is the depth that removed the value
+    char * removed_indirectly; // and whether it was removed by propagate_pending
+};
+
+// Short nogoods learned by the search, listed under each of their
+// (variable, value) pairs (see backjumping.c)
+struct nogood_cache{
+    int times; // Number of potential section times
+    int next_entry; // The entry the next nogood replaces
+    int * size; // The number of pairs in each entry, 0 if it is unused
+    int * vars; // The variable and value of each pair, NOGOOD_SIZE slots per entry
+    int * values;
+    int * next; // The next and previous slots with the same variable and value, or -1
+    int * prev;
+    int * head; // The first slot for each var * times + value, or -1
+};
+
 // Function prototypes for assignment.c
-struct assignment * initialize_assignment(int total, int leaders, int times, int * genders, struct domain * bin_constraints);
+struct assignment * initialize_assignment(int total, int leaders, int times, int * genders, struct domain * bin_constraints, struct weights * weights, int * rank, int * hint);
 void free_assignment(struct assignment * a);
+long long section_gender_error(struct assignment * a, int section);
+void update_section_cost(struct assignment * a, int section, int sign);
+void update_section_counts(struct assignment * a, int section, int sign);
 void set_section(struct assignment * a, int key, int item);
+void find_forbidden_sections(struct assignment * a, struct domain * D);
+int * preference_ranks(struct domain * D, int total, int times);
+int test_bit(uint64_t * bits, int i);
+void set_bit(uint64_t * bits, int i);
 int get_section(struct assignment * a, int key);
 int equal_assignments(struct assignment * a, struct assignment * b);
 void print_assignment(struct assignment * assignment);
@@ -46,10 +199,93 @@ struct assignment * deepcopy_assignment(struct assignment * original);
 void zeros(int * a, int n);
 double gender_cost(int section, struct assignment * a);
 double cost(struct assignment * a);
+int compare_ints(const void * x, const void * y);
+double gender_lower_bound(int section, int remaining_males, int remaining_females, struct assignment * a);
+double excess_bound(struct assignment * a);
+double lower_bound(struct assignment * a);
+int check_bin_constraints(struct assignment * a, int var, int val);
 int is_consistent(struct assignment * a, int var, int value);
-int backtracking_search(struct assignment * a, struct domain * D, int * result, int max_seconds);
+void count_degrees(struct assignment * a, int * degree);
+int count_remaining_values(struct assignment * a, struct domain * d, int var, int limit);
+int select_variable(struct assignment * a, struct domain * D, struct domain_state * s, int * degree, int depth, int flags);
+int select_value(struct assignment * a, struct domain d, int var, uint64_t * tried, int flags);
+long long monotonic_milliseconds();
+int out_of_time(struct incumbent * best);
+struct incumbent * initialize_incumbent(int total, int * result, long long deadline, solution_callback on_improve);
+void free_incumbent(struct incumbent * best);
+double incumbent_cost(struct incumbent * best);
+int offer_solution(struct incumbent * best, struct assignment * a, double c);
+int backtracking_search(struct assignment * a, struct domain * D, struct incumbent * best, int flags, long node_limit);
+
+// Function prototypes for propagation.c
+struct domain_state * initialize_domain_state(struct assignment * a, struct domain * D);
+void free_domain_state(struct domain_state * s);
+int is_live(struct domain_state * s, int var, int value);
+int domain_size(struct domain_state * s, int var);
+int remove_value(struct domain_state * s, int var, int value);
+void undo_trail(struct domain_state * s, int mark);
+int propagate_pending(struct domain_state * s);
+int propagate_initial(struct domain_state * s);
+int propagate(struct domain_state * s, int var, int value);
+
+// Function prototypes for symmetry.c
+void find_symmetries(struct assignment * a, struct domain * D);
+int leaders_in_order(struct assignment * a, int var, int value);
+int sections_in_order(struct assignment * a, int value);
+
+// Function prototypes for backjumping.c
+void add_all_below(uint64_t * conflict, int depth);
+int highest_bit(uint64_t * conflict, int words);
+int count_bits(uint64_t * conflict, int words);
+void blame(uint64_t * conflict, int * depth_of, int var);
+void explain_removal(struct domain_state * s, int var, int value, uint64_t * conflict, int depth);
+void explain_wipeout(struct domain_state * s, struct domain * D, uint64_t * conflict, int depth);
+void explain_inconsistency(struct assignment * a, int var, int value, int * depth_of, uint64_t * conflict, int depth);
+struct nogood_cache * initialize_nogood_cache(int total, int times);
+void free_nogood_cache(struct nogood_cache * c);
+void forget_nogood(struct nogood_cache * c, int entry);
+int same_nogood(struct nogood_cache * c, int entry, int * vars, int * values, int size);
+void learn_nogood(struct nogood_cache * c, int * vars, int * values, int size);
+int nogood_conflict(struct nogood_cache * c, struct assignment * a, int var, int value, int * depth_of, uint64_t * conflict);
+
+// Function prototypes for restarts.c
+long luby(long i);
+void restart_search(struct problem * p, struct incumbent * best, int flags, unsigned int seed);
+
+// Function prototypes for repair.c
+int in_domain(struct domain d, int value);
+int keep_previous(struct assignment * a, struct domain * D, int * previous, int keep_students);
+int repair_search(struct problem * p, struct incumbent * best, int * previous, int flags);
+struct domain * hinted_domains(struct domain * D, int n, int * hint);
+int offer_hint(struct problem * p, struct incumbent * best, int * hint);
+
+// Function prototypes for flow.c
+int student_can_take(struct assignment * a, struct domain_state * s, int var, int section);
+long long marginal_cost(struct assignment * a, int count, long long big);
+int flow_students(struct assignment * a, struct domain * D, struct domain_state * s);
+void unassign_students(struct assignment * a);
+
+// Function prototypes for localsearch.c
+int students_can_have_leader(struct assignment * a, int section, int leader);
+int move_student(struct assignment * a, struct domain * D, uint64_t * allowed, unsigned int * state, int * moved);
+int swap_sections(struct assignment * a, uint64_t * allowed, unsigned int * state, int leaders, int * moved);
+void undo_move(struct assignment * a, int * moved);
+void offer_assignment(struct incumbent * best, struct assignment * a, int * assignment);
+void improve_assignment(struct problem * p, struct incumbent * best, int max_milliseconds, unsigned int seed);
+
+// Function prototypes for portfolio.c
+unsigned int next_random(unsigned int * state);
+struct domain * shuffled_domains(struct domain * D, int n, unsigned int seed);
+void free_domains(struct domain * D, int n);
+int portfolio_flags(int flags, int thread);
+unsigned int thread_seed(unsigned int seed, int thread);
+void portfolio_search(struct problem * p, struct incumbent * best, int flags, int threads, unsigned int seed);
 
 // Function prototypes for assign_students.c
-int * assign_students(struct domain * D, int total, int leaders, int times, int * genders, struct domain * bin_constraints, int max_seconds);
+int assign_students_into(int * result, struct domain * D, int total, int leaders, int times, int * genders, struct domain * bin_constraints, int max_milliseconds, int flags, int threads, int improve_milliseconds, solution_callback on_improve, unsigned int seed, int * previous, int * hint, double upper_bound, struct weights * weights);
+struct domain * domains_from_offsets(int * offsets, int * values, int n);
+int assign_students_flat(int * result, int * domain_offsets, int * domain_values, int total, int leaders, int times, int * genders, int * constraint_offsets, int * constraint_values, int max_milliseconds, int flags, int threads, int improve_milliseconds, solution_callback on_improve, unsigned int seed, int * previous, int * hint, double upper_bound, struct weights * weights);
+int * assign_students(struct domain * D, int total, int leaders, int times, int * genders, struct domain * bin_constraints, int max_milliseconds, int flags, int threads, int improve_milliseconds, solution_callback on_improve, unsigned int seed, int * previous, int * hint, double upper_bound, struct weights * weights);
+void free_result(int * result);
 
 #endif
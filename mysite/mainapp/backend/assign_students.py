@@ -1,44 +1,149 @@
 from section_assignment import *
-from random_data_generator import *
+from presolve import presolve, Infeasible
 from ctypes import *
+from array import array
+import multiprocessing
+import os
+import sys
 
-# The python equivalent of the C domain structure
-class domain(Structure):
-    _fields_ = [("size", c_int), ("values", POINTER(c_int))]
-
-# Function that converts a single python domain to a c domain
-def py_domain_to_c_domain(d):
-    values = (c_int * len(d))(*list(d))
-    size = len(d)
-    return domain(size, values)
-
-# Function that converts a python list of domains to a c pointer to domain
-def py_domains_to_c_domains(ds):
-    d_list = map(lambda d : py_domain_to_c_domain(d), ds)
-    return (domain * len(d_list))(*d_list)
-
-def list_from_pointer(p_int, n):
-    ls = []
-    for i in range(n):
-        ls.append(p_int[i])
-    return ls
-
-# Load the shared C library and extract the needed function
-libbt = CDLL("./libbt.so")
-solver = libbt.assign_students
-solver.restype = POINTER(c_int)
-
-# Data should be a dictionary with student names as keys.
-def assign_students(data, max_time):
-    D, X, ints_to_domains, leader_count, gender_table, bin_constraints = generate_availability_problem(data)
-    genders = (c_int * len(X))(*gender_table)
-    c_D = py_domains_to_c_domains(D)
-    c_bin_constrains = py_domains_to_c_domains(bin_constraints)
-    c_result = solver(c_D, c_int(len(X)), c_int(leader_count), c_int(len(ints_to_domains)), genders, c_bin_constraints, max_time)
-    result = list_from_pointer(c_result, len(X))
+# Function that lets C read and write an array in place
+def c_int_array(a):
+    return (c_int * len(a)).from_buffer(a)
+
+# Where make leaves the shared C library, next to this file
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libbt.so')
+
+_solver = None
+_loaded = False
+
+# Load the shared C library on first use and extract the needed function, or
+# return None if the library has not been built. The solver reads the
+# problem from and writes the result into buffers owned by the caller so
+# nothing is copied on the way and nothing is left to free.
+def c_solver():
+    global _solver, _loaded
+    if not _loaded:
+        try:
+            _solver = CDLL(LIBRARY_PATH).assign_students_flat
+            _solver.restype = c_int
+        except OSError:
+            _solver = None
+        _loaded = True
+    return _solver
+
+# Search flags understood by the C solver (see assign_students.h)
+MRV_ORDERING = 1
+FORWARD_CHECKING = 2
+BRANCH_AND_BOUND = 4
+STUDENT_FLOW = 8
+LOCAL_SEARCH = 16
+SYMMETRY_BREAKING = 32
+BACKJUMPING = 64
+NOGOOD_LEARNING = 128
+RANDOM_RESTARTS = 256
+LEAST_LOADED = 512
+
+# The C type of the function told about each improved assignment
+SOLUTION_CALLBACK = CFUNCTYPE(None, POINTER(c_int), c_int, c_double)
+
+# The weights of the cost terms (see struct weights in assign_students.h)
+class Weights(Structure):
+    _fields_ = [('size', c_double), ('gender', c_double), ('preference', c_double)]
+
+DEFAULT_WEIGHTS = {'size' : 2.0, 'gender' : 1.0, 'preference' : 0.0}
+
+def student_to_section_from_result(result, X, ints_to_domains):
     student_to_section = {}
     for i in range(len(result)):
         student_to_section[X[i]] = ints_to_domains[result[i]] if result[i] >= 0 else "NO ASSIGNMENT"
     return student_to_section
 
+# The sections of an assignment, given like the ones returned, as an array
+# with the number of each variable's section or -1 if it has none
+def assignment_to_array(assignment, X, ints_to_domains):
+    domains_to_ints = dict((section, i) for i, section in enumerate(ints_to_domains))
+    return array('i', [domains_to_ints.get(assignment.get(name), -1) for name in X])
+
+# Data should be a dictionary with student names as keys and max_time is in
+# seconds, fractions of a second included.
+# Sections are tried in each student's order of preference, except that by
+# default the sections with the fewest students go first (LEAST_LOADED).
+# By default one search thread is run for every core (see portfolio.c).
+# With LOCAL_SEARCH in flags the first solution is improved for improve_time
+# seconds (see localsearch.c).
+# If on_improve is given it is called with every better assignment found, as
+# a dictionary like the one returned, and its cost.
+# The same seed gives the same random choices (see restarts.c), so with a
+# single thread a run can be repeated exactly.
+# If previous is an earlier assignment for the course, like one returned here,
+# it is repaired to fit data instead of solving from scratch and the repair is
+# improved for improve_time seconds (see repair.c).
+# If hint is an assignment given the same way, possibly partial or invalid,
+# each student tries their section in it first and a valid hint is the
+# assignment to beat. With upper_bound only assignments costing less than it
+# are looked for, and if there are none every student gets "NO ASSIGNMENT".
+# weights is a dictionary of the weights of the 'size', 'gender' and
+# 'preference' terms of the cost, with DEFAULT_WEIGHTS for any left out. The
+# preference term adds up how far down their section_availability_ordered
+# everyone's section is.
+# Before either solver is called the domains are cut down by presolve, which
+# raises Infeasible with the reasons if the course clearly has no assignment
+# (see presolve.py).
+# Without libbt.so the problem is solved by local search in NumPy instead
+# (see numpy_solver.py), which ignores flags, threads and improve_time and
+# treats previous as a hint.
+def assign_students(data, max_time, flags=MRV_ORDERING | FORWARD_CHECKING | BRANCH_AND_BOUND | SYMMETRY_BREAKING | LEAST_LOADED, threads=None, improve_time=0, on_improve=None, seed=0, previous=None, hint=None, upper_bound=None, weights=None):
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    (X, ints_to_domains, leader_count, genders,
+     domain_offsets, domain_values, constraint_offsets, constraint_values) = generate_availability_problem(data)
+
+    # Without leaders there are no sections to put anyone in
+    if leader_count == 0:
+        return student_to_section_from_result([-1] * len(X), X, ints_to_domains)
+
+    domain_offsets, domain_values = presolve(X, ints_to_domains, leader_count, domain_offsets, domain_values,
+                                             constraint_offsets, constraint_values)
+
+    all_weights = dict(DEFAULT_WEIGHTS)
+    if weights is not None:
+        all_weights.update(weights)
+
+    solver = c_solver()
+    if solver is None:
+        import numpy_solver
+        py_hint = hint if hint is not None else previous
+        if py_hint is not None:
+            py_hint = assignment_to_array(py_hint, X, ints_to_domains)
+        py_on_improve = None
+        if on_improve is not None:
+            def py_on_improve(assignment, cost):
+                on_improve(student_to_section_from_result(assignment, X, ints_to_domains), cost)
+        result = numpy_solver.solve(domain_offsets, domain_values, leader_count, len(ints_to_domains), genders,
+                                    constraint_offsets, constraint_values, max_time, all_weights, seed, py_hint,
+                                    upper_bound, py_on_improve)
+        return student_to_section_from_result(result, X, ints_to_domains)
+
+    # A null function pointer unless there is someone to tell
+    c_on_improve = SOLUTION_CALLBACK()
+    if on_improve is not None:
+        def report(c_assignment, n, cost):
+            on_improve(student_to_section_from_result(c_assignment[:n], X, ints_to_domains), cost)
+        c_on_improve = SOLUTION_CALLBACK(report)
+
+    c_previous = None
+    if previous is not None:
+        c_previous = c_int_array(assignment_to_array(previous, X, ints_to_domains))
+    c_hint = None
+    if hint is not None:
+        c_hint = c_int_array(assignment_to_array(hint, X, ints_to_domains))
+    if upper_bound is None:
+        upper_bound = sys.float_info.max
+    c_weights = byref(Weights(**all_weights))
 
+    result = array('i', [-1]) * len(X)
+    solver(c_int_array(result), c_int_array(domain_offsets), c_int_array(domain_values), c_int(len(X)), c_int(leader_count),
+           c_int(len(ints_to_domains)), c_int_array(genders), c_int_array(constraint_offsets), c_int_array(constraint_values),
+           c_int(int(max_time * 1000)), c_int(flags), c_int(threads), c_int(int(improve_time * 1000)), c_on_improve, c_uint(seed), c_previous,
+           c_hint, c_double(upper_bound), c_weights)
+    return student_to_section_from_result(result, X, ints_to_domains)
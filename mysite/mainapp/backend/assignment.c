@@ -1,12 +1,15 @@
 #include "assign_students.h"
 
-struct assignment * initialize_assignment(int total, int leaders, int times, int * genders, struct domain * bin_constraints){
+struct assignment * initialize_assignment(int total, int leaders, int times, int * genders, struct domain * bin_constraints, struct weights * weights, int * rank, int * hint){
     struct assignment * a = (struct assignment *) malloc(sizeof(struct assignment));
     a->total = total;
     a->leaders = leaders;
     a->students = total - leaders;
     a->genders = genders;
     a->bin_constraints = bin_constraints;
+    a->weights = weights;
+    a->rank = rank;
+    a->hint = hint;
 
     int i;
     int * female_count = (int *) malloc(times * sizeof(int));
@@ -26,6 +29,14 @@ struct assignment * initialize_assignment(int total, int leaders, int times, int
     a->students_assigned = 0;
     a->leaders_assigned = 0;
 
+    // Count the women among the students (leaders excluded)
+    a->female_students = 0;
+    a->female_students_assigned = 0;
+    for (i = leaders; i < total; i++){
+        if (*(genders + i))
+            a->female_students += 1;
+    }
+
     // All of the sections start with no assigned leader
     int * has_leader = (int *) malloc(times * sizeof(int));
     for (i = 0; i < times; i++){
@@ -40,6 +51,44 @@ struct assignment * initialize_assignment(int total, int leaders, int times, int
     }
     a->student_count = student_count;
 
+    // No section has a leader yet
+    a->section_leader = (int *) malloc(times * sizeof(int));
+    for (i = 0; i < times; i++){
+        *(a->section_leader + i) = -1;
+    }
+
+    // Record the leaders each student cannot be with as a bitset so
+    // that a restriction can be checked without scanning the list.
+    a->leader_words = (leaders + 63) / 64;
+    a->cant_be_with = (uint64_t *) calloc(total * a->leader_words + 1, sizeof(uint64_t));
+    int j, r;
+    for (i = leaders; i < total; i++){
+        struct domain restrictions = *(bin_constraints + i);
+        for (j = 0; j < restrictions.size; j++){
+            r = *(restrictions.values + j);
+            if (0 <= r && r < leaders)
+                set_bit(a->cant_be_with + i * a->leader_words, r);
+        }
+    }
+
+    // Filled in by find_forbidden_sections once the domains are known
+    a->section_words = (times + 63) / 64;
+    a->forbidden_sections = NULL;
+
+    // Filled in by find_symmetries
+    a->leader_before = NULL;
+    a->leader_after = NULL;
+    a->section_before = NULL;
+
+    a->size_error = 0;
+    a->excess_error = 0;
+    a->gender_error = 0;
+    a->preference_error = 0;
+
+    a->empty_sections = 0;
+    a->crowded_sections = 0;
+    a->unled_students = 0;
+
     a->section_has_more_than_one_leader = 0;
     a->too_few_students_in_a_section = 0;
     a->student_in_section_with_no_leader = 0;
@@ -52,23 +101,77 @@ void free_assignment(struct assignment * a){
     free(a->section_assignments);
     free(a->has_leader);
     free(a->student_count);
+    free(a->section_leader);
+    free(a->cant_be_with);
+    free(a->forbidden_sections);
+    free(a->leader_before);
+    free(a->leader_after);
+    free(a->section_before);
     free(a);
 }
 
+// The gender cost of a section is computed by squaring the
+// the absolute value of the difference between males and females.
+// However if this value is less than or equal to 1 then a cost of
+// 0 is given.
+long long section_gender_error(struct assignment * a, int section){
+    int females = *(a->female_count + section);
+    int males = *(a->student_count + section) - females;
+    long long diff = males > females ? males - females : females - males;
+    if (diff <= 1 || females == 0 || males == 0)
+        return 0;
+    return diff * diff;
+}
+
+// Add (sign = 1) or remove (sign = -1) the share of the running cost terms
+// that comes from a section. Sections without a leader do not count and a
+// section with several leaders counts once for each of them, just as cost()
+// sums over the leaders. The size error of a section is
+// (students - leaders * count)^2, which is its squared distance from the
+// mean size scaled by leaders^2 so that it stays an exact integer.
+void update_section_cost(struct assignment * a, int section, int sign){
+    int leaders = *(a->has_leader + section);
+    if (!leaders)
+        return;
+    long long diff = ((long long) a->students) - ((long long) a->leaders) * *(a->student_count + section);
+    a->size_error += sign * leaders * diff * diff;
+    if (diff < 0)
+        a->excess_error += sign * leaders * diff * diff;
+    a->gender_error += sign * leaders * section_gender_error(a, section);
+}
+
+// Add (sign = 1) or remove (sign = -1) the contribution of a section to the
+// counts behind the inconsistency flags.
+void update_section_counts(struct assignment * a, int section, int sign){
+    int leaders = *(a->has_leader + section);
+    int students = *(a->student_count + section);
+    if (leaders && !students)
+        a->empty_sections += sign;
+    if (leaders > 1)
+        a->crowded_sections += sign;
+    if (!leaders)
+        a->unled_students += sign * students;
+}
+
 void set_section(struct assignment * a, int key, int item){
+    int section = *(a->section_assignments + key) < 0 ? item : *(a->section_assignments + key);
+    int changed = (*(a->section_assignments + key) < 0) != (item < 0);
+    if (changed){
+        update_section_cost(a, section, -1);
+        update_section_counts(a, section, -1);
+    }
+
     if (*(a->section_assignments + key) < 0 && item >= 0){
         if (key < a->leaders){
             a->leaders_assigned += 1;
             *(a->has_leader + item) += 1;
-            if (*(a->has_leader + item) > 1)
-                a->section_has_more_than_one_leader = 1;
+            *(a->section_leader + item) = key;
         }
         else{
             a->students_assigned += 1;
             *(a->student_count + item) += 1;
-            int count = *(a->student_count + item);
-            if (a->leaders_assigned == a->leaders && !*(a->has_leader + item))
-                a->student_in_section_with_no_leader = 1;
+            if (*(a->genders + key))
+                a->female_students_assigned += 1;
         }
         int gender = *(a->genders + key);
         if (gender){
@@ -80,14 +183,17 @@ void set_section(struct assignment * a, int key, int item){
         if (key < a->leaders){
             a->leaders_assigned -= 1;
             *(a->has_leader + *(a->section_assignments + key)) -= 1;
-            a->section_has_more_than_one_leader = 0;
+
+            // A section with two leaders is never kept by the search, so
+            // it is fine to forget the other one here.
+            if (*(a->section_leader + *(a->section_assignments + key)) == key)
+                *(a->section_leader + *(a->section_assignments + key)) = -1;
         }
         else{
             a->students_assigned -= 1;
             *(a->student_count + *(a->section_assignments + key)) -= 1;
-
-            a->too_few_students_in_a_section = 0;
-            a->student_in_section_with_no_leader = 0;
+            if (*(a->genders + key))
+                a->female_students_assigned -= 1;
         }
         int gender = *(a->genders + key);
         if (gender){
@@ -95,18 +201,88 @@ void set_section(struct assignment * a, int key, int item){
         }
     }
 
-    if (a->students_assigned + a->leaders_assigned == a->total){
-        int i;
-        for (i = 0; i < a->times; i++){
-            int count = *(a->student_count + i);
-            if (!count && *(a->has_leader + i)){
-                a->too_few_students_in_a_section = 1;
-                break;
+    // The preference term only depends on the variable's own section
+    if (a->rank && changed)
+        a->preference_error += (item < 0 ? -1 : 1) * *(a->rank + key * a->times + section);
+
+    *(a->section_assignments + key) = item;
+
+    if (changed){
+        update_section_cost(a, section, 1);
+        update_section_counts(a, section, 1);
+    }
+
+    // The flags follow from the counts, so they are right after any
+    // sequence of assignments and unassignments. Empty sections only
+    // count against complete assignments and students without a leader
+    // only once every leader has been placed.
+    a->section_has_more_than_one_leader = a->crowded_sections > 0;
+    a->too_few_students_in_a_section = a->students_assigned + a->leaders_assigned == a->total &&
+                                       a->empty_sections > 0;
+    a->student_in_section_with_no_leader = a->leaders_assigned == a->leaders &&
+                                           a->unled_students > 0;
+}
+
+// Work out which sections each student can never be in because every leader
+// whose domain includes the section is one the student cannot be with.
+void find_forbidden_sections(struct assignment * a, struct domain * D){
+    int leaders = a->leaders;
+    int times = a->times;
+    int words = a->leader_words;
+    int var, i, section, w, forbidden;
+
+    // The leaders that could take each section
+    uint64_t * section_leaders = (uint64_t *) calloc(times * words + 1, sizeof(uint64_t));
+    for (var = 0; var < leaders; var++){
+        struct domain d = *(D + var);
+        for (i = 0; i < d.size; i++){
+            section = *(d.values + i);
+            if (0 <= section && section < times)
+                set_bit(section_leaders + section * words, var);
+        }
+    }
+
+    free(a->forbidden_sections);
+    a->forbidden_sections = (uint64_t *) calloc(a->total * a->section_words + 1, sizeof(uint64_t));
+    for (var = leaders; var < a->total; var++){
+        if (!(a->bin_constraints + var)->size)
+            continue;
+        uint64_t * cant_be_with = a->cant_be_with + var * words;
+        for (section = 0; section < times; section++){
+            forbidden = 1;
+            for (w = 0; w < words && forbidden; w++){
+                forbidden = !(*(section_leaders + section * words + w) & ~*(cant_be_with + w));
             }
+            if (forbidden)
+                set_bit(a->forbidden_sections + var * a->section_words, section);
         }
     }
+    free(section_leaders);
+}
 
-    *(a->section_assignments + key) = item;
+// A table of how far down each variable's preferences each section is, with
+// rank[var * times + section] being 0 for the first section in the domain of
+// var, 1 for the next and so on. Sections outside the domain get 0.
+int * preference_ranks(struct domain * D, int total, int times){
+    int * rank = (int *) calloc(total * times + 1, sizeof(int));
+    int var, i, section;
+    for (var = 0; var < total; var++){
+        struct domain d = *(D + var);
+        for (i = d.size - 1; i >= 0; i--){
+            section = *(d.values + i);
+            if (0 <= section && section < times)
+                *(rank + var * times + section) = i;
+        }
+    }
+    return rank;
+}
+
+int test_bit(uint64_t * bits, int i){
+    return (*(bits + (i >> 6)) >> (i & 63)) & 1;
+}
+
+void set_bit(uint64_t * bits, int i){
+    *(bits + (i >> 6)) |= ((uint64_t) 1) << (i & 63);
 }
 
 int get_section(struct assignment * a, int key){
@@ -201,16 +377,60 @@ struct assignment * deepcopy_assignment(struct assignment * original){
     copy->total = original->total;
     copy->leaders = original->leaders;
     copy->students = original->students;
+    copy->weights = original->weights;
+    copy->rank = original->rank;
+    copy->hint = original->hint;
     copy->section_assignments = (int *) malloc(copy->total * sizeof(int));
     memcpy(copy->section_assignments, original->section_assignments, copy->total * sizeof(int));
 
     copy->times = original->times;
     copy->students_assigned = original->students_assigned;
     copy->leaders_assigned = original->leaders_assigned;
+    copy->female_students = original->female_students;
+    copy->female_students_assigned = original->female_students_assigned;
+    copy->size_error = original->size_error;
+    copy->excess_error = original->excess_error;
+    copy->gender_error = original->gender_error;
+    copy->preference_error = original->preference_error;
+    copy->empty_sections = original->empty_sections;
+    copy->crowded_sections = original->crowded_sections;
+    copy->unled_students = original->unled_students;
     copy->has_leader = (int *) malloc(copy->times * sizeof(int));
     memcpy(copy->has_leader, original->has_leader, copy->times * sizeof(int));
     copy->student_count = (int *) malloc(copy->times * sizeof(int));
     memcpy(copy->student_count, original->student_count, copy->times * sizeof(int));
+    copy->section_leader = (int *) malloc(copy->times * sizeof(int));
+    memcpy(copy->section_leader, original->section_leader, copy->times * sizeof(int));
+
+    copy->genders = original->genders;
+    copy->bin_constraints = original->bin_constraints;
+    copy->female_count = (int *) malloc(copy->times * sizeof(int));
+    memcpy(copy->female_count, original->female_count, copy->times * sizeof(int));
+
+    // The bitsets are owned by each assignment, forbidden_sections may not
+    // have been computed yet
+    copy->leader_words = original->leader_words;
+    copy->cant_be_with = (uint64_t *) malloc((copy->total * copy->leader_words + 1) * sizeof(uint64_t));
+    memcpy(copy->cant_be_with, original->cant_be_with, (copy->total * copy->leader_words + 1) * sizeof(uint64_t));
+    copy->section_words = original->section_words;
+    copy->forbidden_sections = NULL;
+    if (original->forbidden_sections){
+        copy->forbidden_sections = (uint64_t *) malloc((copy->total * copy->section_words + 1) * sizeof(uint64_t));
+        memcpy(copy->forbidden_sections, original->forbidden_sections, (copy->total * copy->section_words + 1) * sizeof(uint64_t));
+    }
+    copy->leader_before = NULL;
+    copy->leader_after = NULL;
+    copy->section_before = NULL;
+    if (original->leader_before){
+        copy->leader_before = (int *) malloc((copy->leaders + 1) * sizeof(int));
+        memcpy(copy->leader_before, original->leader_before, (copy->leaders + 1) * sizeof(int));
+        copy->leader_after = (int *) malloc((copy->leaders + 1) * sizeof(int));
+        memcpy(copy->leader_after, original->leader_after, (copy->leaders + 1) * sizeof(int));
+    }
+    if (original->section_before){
+        copy->section_before = (int *) malloc((copy->times + 1) * sizeof(int));
+        memcpy(copy->section_before, original->section_before, (copy->times + 1) * sizeof(int));
+    }
 
     copy->section_has_more_than_one_leader = original->section_has_more_than_one_leader;
     copy->too_few_students_in_a_section = original->too_few_students_in_a_section;
@@ -0,0 +1,245 @@
+#include "assign_students.h"
+
+// Conflict directed backjumping and nogood learning for the backtracking
+// search. Every depth of the search keeps a conflict set: a bitset of the
+// earlier depths whose assignments ruled out values of the variable at that
+// depth. When the variable runs out of values the search jumps straight back
+// to the deepest depth in its conflict set, skipping the variables in between
+// since changing them could not help, and hands the rest of the set on to the
+// depth it jumped to.
+//
+// The reasons a value is ruled out are exact when a single earlier assignment
+// is to blame: a leader already in the section, a leader the student cannot be
+// with, or an interchangeable leader (see symmetry.c). Everything that depends
+// on the assignment as a whole, such as running out of leaders or students for
+// a section in propagate_pending, the bounds of BRANCH_AND_BOUND and finding a
+// solution, blames every earlier depth, which is just chronological
+// backtracking.
+//
+// A conflict set that runs out is a nogood: the assignments at its depths can
+// never be part of a better solution. With NOGOOD_LEARNING the short ones are
+// kept in a bounded cache so the search can reject them the next time they
+// come up on another branch. Each nogood is listed under every one of its
+// (variable, value) pairs so only the nogoods of the value being tried are
+// looked at.
+
+// Set the bits of the depths below depth
+void add_all_below(uint64_t * conflict, int depth){
+    int w;
+    for (w = 0; w < depth / 64; w++){
+        *(conflict + w) = ~((uint64_t) 0);
+    }
+    if (depth % 64)
+        *(conflict + depth / 64) |= (((uint64_t) 1) << (depth % 64)) - 1;
+}
+
+// The deepest depth in a conflict set, -1 if it is empty
+int highest_bit(uint64_t * conflict, int words){
+    int w;
+    for (w = words - 1; w >= 0; w--){
+        if (*(conflict + w))
+            return w * 64 + 63 - __builtin_clzll(*(conflict + w));
+    }
+    return -1;
+}
+
+int count_bits(uint64_t * conflict, int words){
+    int w, count = 0;
+    for (w = 0; w < words; w++){
+        count += __builtin_popcountll(*(conflict + w));
+    }
+    return count;
+}
+
+// Add the depth var was assigned at to a conflict set. Variables assigned
+// before the search started, such as the ones a repair keeps, have no depth
+// and can never be changed so they are never to blame.
+void blame(uint64_t * conflict, int * depth_of, int var){
+    if (*(depth_of + var) >= 0)
+        set_bit(conflict, *(depth_of + var));
+}
+
+// Add the reason value was pruned from the domain of var to the conflict set
+// of the variable at depth.
+void explain_removal(struct domain_state * s, int var, int value, uint64_t * conflict, int depth){
+    int at = *(s->removed_at + var * s->times + value);
+
+    // Removed before the search started
+    if (at < 0)
+        return;
+    if (*(s->removed_indirectly + var * s->times + value))
+        add_all_below(conflict, at < depth ? at + 1 : depth);
+    else if (at < depth)
+        set_bit(conflict, at);
+}
+
+// Add the reasons the domain wiped out by the last call to propagate was
+// emptied to the conflict set of the variable at depth.
+void explain_wipeout(struct domain_state * s, struct domain * D, uint64_t * conflict, int depth){
+    int var = s->wiped;
+    struct domain d = *(D + var);
+    int i, value;
+    for (i = 0; i < d.size; i++){
+        value = *(d.values + i);
+        if (0 <= value && value < s->times && !is_live(s, var, value))
+            explain_removal(s, var, value, conflict, depth);
+    }
+}
+
+// Add the reason is_consistent rejected value for var to the conflict set of
+// the variable at depth. depth_of gives the depth each variable was assigned at.
+void explain_inconsistency(struct assignment * a, int var, int value, int * depth_of, uint64_t * conflict, int depth){
+    int leader = *(a->section_leader + value);
+    int other;
+    if (!a->crowded_sections){
+        if (var < a->leaders){
+            // Another leader already has the section
+            if (leader >= 0){
+                blame(conflict, depth_of, leader);
+                return;
+            }
+
+            // An interchangeable leader is out of order
+            if (a->leader_before){
+                other = *(a->leader_before + var);
+                if (other >= 0 && get_section(a, other) >= value){
+                    blame(conflict, depth_of, other);
+                    return;
+                }
+                other = *(a->leader_after + var);
+                if (other >= 0 && get_section(a, other) >= 0 && get_section(a, other) <= value){
+                    blame(conflict, depth_of, other);
+                    return;
+                }
+            }
+        }
+        else{
+            // The student can never be in the section
+            if (a->forbidden_sections && test_bit(a->forbidden_sections + var * a->section_words, value))
+                return;
+
+            // The student cannot be with the section's leader
+            if (leader >= 0 && !check_bin_constraints(a, var, value)){
+                blame(conflict, depth_of, leader);
+                return;
+            }
+        }
+    }
+
+    // Everything else depends on the assignment as a whole
+    add_all_below(conflict, depth);
+}
+
+struct nogood_cache * initialize_nogood_cache(int total, int times){
+    struct nogood_cache * c = (struct nogood_cache *) malloc(sizeof(struct nogood_cache));
+    int slots = NOGOOD_CACHE * NOGOOD_SIZE;
+    int i;
+    c->times = times;
+    c->next_entry = 0;
+    c->size = (int *) calloc(NOGOOD_CACHE, sizeof(int));
+    c->vars = (int *) malloc(slots * sizeof(int));
+    c->values = (int *) malloc(slots * sizeof(int));
+    c->next = (int *) malloc(slots * sizeof(int));
+    c->prev = (int *) malloc(slots * sizeof(int));
+    c->head = (int *) malloc((total * times + 1) * sizeof(int));
+    for (i = 0; i < total * times; i++){
+        *(c->head + i) = -1;
+    }
+    return c;
+}
+
+void free_nogood_cache(struct nogood_cache * c){
+    free(c->size);
+    free(c->vars);
+    free(c->values);
+    free(c->next);
+    free(c->prev);
+    free(c->head);
+    free(c);
+}
+
+// Take a nogood out of the lists it is in to make room for another
+void forget_nogood(struct nogood_cache * c, int entry){
+    int k, slot, key;
+    for (k = 0; k < *(c->size + entry); k++){
+        slot = entry * NOGOOD_SIZE + k;
+        key = *(c->vars + slot) * c->times + *(c->values + slot);
+        if (*(c->prev + slot) >= 0)
+            *(c->next + *(c->prev + slot)) = *(c->next + slot);
+        else
+            *(c->head + key) = *(c->next + slot);
+        if (*(c->next + slot) >= 0)
+            *(c->prev + *(c->next + slot)) = *(c->prev + slot);
+    }
+    *(c->size + entry) = 0;
+}
+
+// Whether every pair of a nogood entry is in vars and values
+int same_nogood(struct nogood_cache * c, int entry, int * vars, int * values, int size){
+    int k, i, found;
+    if (*(c->size + entry) != size)
+        return 0;
+    for (k = 0; k < size; k++){
+        found = 0;
+        for (i = 0; i < size && !found; i++){
+            found = *(c->vars + entry * NOGOOD_SIZE + k) == *(vars + i) &&
+                    *(c->values + entry * NOGOOD_SIZE + k) == *(values + i);
+        }
+        if (!found)
+            return 0;
+    }
+    return 1;
+}
+
+// Remember that the variables in vars cannot take the values in values all at
+// once. Nogoods with more than NOGOOD_SIZE pairs are not worth keeping and once
+// the cache is full the oldest nogood is forgotten.
+void learn_nogood(struct nogood_cache * c, int * vars, int * values, int size){
+    int k, slot, key, entry;
+    if (size < 1 || size > NOGOOD_SIZE)
+        return;
+
+    // Skip nogoods that are already known
+    for (slot = *(c->head + *vars * c->times + *values); slot >= 0; slot = *(c->next + slot)){
+        if (same_nogood(c, slot / NOGOOD_SIZE, vars, values, size))
+            return;
+    }
+
+    entry = c->next_entry;
+    c->next_entry = (entry + 1) % NOGOOD_CACHE;
+    forget_nogood(c, entry);
+    *(c->size + entry) = size;
+    for (k = 0; k < size; k++){
+        slot = entry * NOGOOD_SIZE + k;
+        key = *(vars + k) * c->times + *(values + k);
+        *(c->vars + slot) = *(vars + k);
+        *(c->values + slot) = *(values + k);
+        *(c->prev + slot) = -1;
+        *(c->next + slot) = *(c->head + key);
+        if (*(c->head + key) >= 0)
+            *(c->prev + *(c->head + key)) = slot;
+        *(c->head + key) = slot;
+    }
+}
+
+// Whether giving var the value would complete a known nogood. If so the
+// depths of the rest of the nogood are added to the conflict set.
+int nogood_conflict(struct nogood_cache * c, struct assignment * a, int var, int value, int * depth_of, uint64_t * conflict){
+    int slot, entry, k, complete;
+    for (slot = *(c->head + var * c->times + value); slot >= 0; slot = *(c->next + slot)){
+        entry = slot / NOGOOD_SIZE;
+        complete = 1;
+        for (k = 0; k < *(c->size + entry) && complete; k++){
+            if (*(c->vars + entry * NOGOOD_SIZE + k) != var)
+                complete = get_section(a, *(c->vars + entry * NOGOOD_SIZE + k)) == *(c->values + entry * NOGOOD_SIZE + k);
+        }
+        if (complete){
+            for (k = 0; k < *(c->size + entry); k++){
+                if (*(c->vars + entry * NOGOOD_SIZE + k) != var)
+                    blame(conflict, depth_of, *(c->vars + entry * NOGOOD_SIZE + k));
+            }
+            return 1;
+        }
+    }
+    return 0;
+}
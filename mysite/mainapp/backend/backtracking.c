@@ -1,7 +1,7 @@
 #include "assign_students.h"
-#include <math.h>
 #include <float.h>
 #include <time.h>
+#include <limits.h>
 
 // Zero out an array, a, of length n.
 void zeros(int * a, int n){
@@ -11,185 +11,650 @@ void zeros(int * a, int n){
     }
 }
 
-// The gender cost of a section is computed by squaring the 
-// the absolute value of the difference between males and females.
-// However if this value is less than or equal to 1 then a cost of 
-// 0 is given.
+// The gender cost of a section, see section_gender_error in assignment.c.
 double gender_cost(int section, struct assignment * a){
+    return (double) section_gender_error(a, section);
+}
+
+// The cost function is computed on complete assignments.
+// It scores the assignments based on gender balance,
+// balance of the number of students in each section and
+// how well everyone got the sections they preferred.
+//
+// The section imbalance is the sum of the squared differences
+// between the number of students in each section and the total
+// number of non-leaders students divided by the number of leaders.
+// See gender_cost above for an explaination of how gender_cost
+// is determined. The preference cost is the sum of the ranks of
+// everyone's sections (see preference_ranks). The sums are kept up
+// to date by set_section so the cost is available without looking
+// at the sections.
+double cost(struct assignment * a){
+    double scale = ((double) a->leaders) * ((double) a->leaders);
+    double error = ((double) a->size_error) / scale;
+
+    // By default the total cost is twice the section imbalance
+    // cost plus the gender imbalance cost. The 2 is given to add
+    // greater signifigance to balancing the sizes.
+    return a->weights->size * error + a->weights->gender * ((double) a->gender_error) +
+           a->weights->preference * ((double) a->preference_error);
+}
+
+// A cheap lower bound on the cost of any completion of a. Sections only
+// grow as students are added, so the error of those already above the
+// mean size can never go away, and neither can the ranks of the sections
+// already given out.
+double excess_bound(struct assignment * a){
+    double scale = ((double) a->leaders) * ((double) a->leaders);
+    return a->weights->size * (((double) a->excess_error) / scale) +
+           a->weights->preference * ((double) a->preference_error);
+}
+
+int compare_ints(const void * x, const void * y){
+    return *((const int *) x) - *((const int *) y);
+}
+
+// An optimistic version of gender_cost for a section that may still receive
+// some of the remaining students. Students can only be added, so the gap
+// between men and women can move anywhere between the current gap minus the
+// remaining women and the current gap plus the remaining men. The section is
+// free if the gap can be closed to at most one or if there could end up
+// being no men or no women, otherwise the smallest reachable gap is charged.
+double gender_lower_bound(int section, int remaining_males, int remaining_females, struct assignment * a){
     int females = *(a->female_count + section);
     int males = *(a->student_count + section) - females;
-    double diff = fabs(((double) males) - ((double) females));
-    if (diff <= 1.0 || females == 0 || males == 0){
+    int low = (males - females) - remaining_females;
+    int high = (males - females) + remaining_males;
+    if (females == 0 || (males <= 0 && -males <= remaining_males) || (low <= 1 && high >= -1)){
         return 0.0;
     }
-    else{
-        return pow(diff, 2.0);
-    }
+    int gap = low > 1 ? low : high;
+    return (double) (gap * gap);
 }
 
-// The cost function is computed on complete assignments.
-// It scores the assignments based on gender balance and
-// balance of the number of students in each section.
-double cost(struct assignment * a){
+// An admissible lower bound on the cost of every complete assignment that
+// extends the partial assignment a.
+//
+// Every section that ends up with a leader keeps the students it already has
+// and needs at least one, and the sections of the unassigned leaders hold at
+// least one student each. The section imbalance is smallest when the
+// remaining students fill the smallest sections up to a common level, which
+// is found by water filling over the sorted counts. The gender term uses
+// gender_lower_bound for each section that already has a leader and the
+// preference term counts the variables assigned so far.
+double lower_bound(struct assignment * a){
     int leaders = a->leaders;
-    double total_gender_cost = 0.0;
-    double error = 0.0;
+    int counts[leaders];
+    int i, j, section, count;
     double mean = ((double) a->students) / ((double) a->leaders);
+    double total_gender_cost = 0.0;
+    int remaining_females = a->female_students - a->female_students_assigned;
+    int remaining_males = (a->students - a->students_assigned) - remaining_females;
+
+    j = 0;
+    for (section = 0; section < a->times && j < leaders; section++){
+        for (i = 0; i < *(a->has_leader + section) && j < leaders; i++){
+            count = *(a->student_count + section);
+            *(counts + j) = count > 0 ? count : 1;
+            total_gender_cost += gender_lower_bound(section, remaining_males, remaining_females, a);
+            j++;
+        }
+    }
+    for (; j < leaders; j++){
+        *(counts + j) = 1;
+    }
+    qsort(counts, leaders, sizeof(int), compare_ints);
 
-    // The section imbalance is the sum of the squared differences 
-    // between the number of students in each section and the total
-    // number of non-leaders students divided by the number of leaders. 
-    // See gender_cost above for an explaination of how gender_cost
-    // is determined.
-    int i, count, section;
-    for (i = 0; i < leaders; i++){
-        section = *(a->section_assignments + i);
-        count = *(a->student_count + section);
-        error += pow((mean - count), 2.0);
-        total_gender_cost += gender_cost(section, a);
-    } 
-
-    // The total cost is twice the section imbalance cost
-    // plus the gender imbalance cost. The 2 is given to 
-    // add greater signifigance to balancing the sizes.
-    return 2*error + total_gender_cost;
-}
-
-// Make sure none of the binary constraints are violated. This code is O(n^2) where n 
-// is the number of section leaders. The worst case is when the student cannot be with
-// any section leader. However, most students will not have any restrictions in which 
-// case this will take up no time. If they do have an issue it will probably only be 
-// with a single TA. I do not think it is worthwhile to store additional information in the
-// the assignment data structure or use a hashtable to improve the runtime.
+    // Find how many of the smallest sections get raised to the common level.
+    // If even the smallest section is above its level the counts already
+    // need more students than there are and no level applies.
+    double level = 0.0;
+    int above = 0;
+    for (j = leaders; j > 0; j--){
+        level = ((double) (a->students - above)) / ((double) j);
+        if (level >= *(counts + j - 1))
+            break;
+        above += *(counts + j - 1);
+    }
+
+    double error = j * (level - mean) * (level - mean);
+    for (i = j; i < leaders; i++){
+        error += (*(counts + i) - mean) * (*(counts + i) - mean);
+    }
+
+    // Weighted the same way as cost
+    return a->weights->size * error + a->weights->gender * total_gender_cost +
+           a->weights->preference * ((double) a->preference_error);
+}
+
+// Make sure none of the binary constraints are violated. The leader of the
+// section is looked up in section_leader and checked against the bitset
+// of leaders the student cannot be with, so this takes constant time no
+// matter how many restrictions the student has. Leaders are placed before
+// students so only students need to be checked.
 int check_bin_constraints(struct assignment * a, int var, int val){
     if (var < a->leaders){
         return 1;
     }
     else{
+        int leader = *(a->section_leader + val);
+        return leader < 0 || !test_bit(a->cant_be_with + var * a->leader_words, leader);
+    }
+}
+
+// Checks if the assignment would be consistent if the unassigned variable
+// var took on the given value from its domain. The counts kept by set_section
+// give the answer without making the assignment.
+int is_consistent(struct assignment * a, int var, int value){
+    int complete = a->students_assigned + a->leaders_assigned + 1 == a->total;
+    int leaders = *(a->has_leader + value);
+    int students = *(a->student_count + value);
+    int empty_sections = a->empty_sections;
+
+    if (a->crowded_sections)
+        return 0;
+
+    if (var < a->leaders){
+        // A section can only have one leader
+        if (leaders)
+            return 0;
+
+        // Once the last leader is placed every student must have a leader
+        if (a->leaders_assigned + 1 == a->leaders && a->unled_students - students > 0)
+            return 0;
+
+        // Only one order of interchangeable leaders and sections is searched
+        if (!leaders_in_order(a, var, value))
+            return 0;
+        if (a->leaders_assigned + 1 == a->leaders && !sections_in_order(a, value))
+            return 0;
+
+        if (!students)
+            empty_sections += 1;
+    }
+    else{
+        // Students cannot be in a section without a leader once they are all placed
+        if (a->leaders_assigned == a->leaders && !leaders)
+            return 0;
+
+        if (leaders && !students)
+            empty_sections -= 1;
+
+        // Sections none of the student's possible leaders can take
+        if (a->forbidden_sections && test_bit(a->forbidden_sections + var * a->section_words, value))
+            return 0;
+
+        // Check the binary constraints
+        if (!check_bin_constraints(a, var, value))
+            return 0;
+    }
+
+    // A complete assignment cannot have a section with a leader but no students
+    return !(complete && empty_sections > 0);
+}
+
+// Count how many of the binary constraints each variable takes part in.
+// A student's restrictions name the leaders they cannot be with, so each
+// restriction counts once against the student and once against the leader.
+void count_degrees(struct assignment * a, int * degree){
+    int var, i, r;
+    zeros(degree, a->total);
+    for (var = a->leaders; var < a->total; var++){
         struct domain restrictions = *(a->bin_constraints + var);
-        int i, j;
-        for(i = 0; i < restrictions.size; i++){
-            for(j = 0; j < a->leaders; j++){
-                if ((*(a->section_assignments + j) == val) && (*(restrictions.values + i) == j))
-                    return 0;
+        for (i = 0; i < restrictions.size; i++){
+            r = *(restrictions.values + i);
+            if (0 <= r && r < a->leaders){
+                *(degree + var) += 1;
+                *(degree + r) += 1;
             }
         }
-        return 1;
     }
 }
 
-// Checks if the assignment would be consistent if var took 
-// on the given value from its domain.
-int is_consistent(struct assignment * a, int var, int value){
+// Count the values left in the domain of var that are consistent with
+// the current assignment. Counting stops as soon as the count passes
+// limit since the caller is only interested in smaller counts.
+int count_remaining_values(struct assignment * a, struct domain * d, int var, int limit){
+    int i, count = 0;
+    for (i = 0; i < d->size && count <= limit; i++){
+        if (is_consistent(a, var, *(d->values + i)))
+            count++;
+    }
+    return count;
+}
+
+// Choose the variable to assign at the given depth of the search. Without
+// MRV_ORDERING the variables are taken in index order, leaders first. With
+// it the unassigned variable with the fewest consistent values left is
+// chosen (minimum remaining values) and ties are broken in favor of the
+// variable involved in the most binary constraints. When forward checking
+// is on the live domain sizes already give the remaining values (a
+// population count for bitset domains). Leaders
+// are still placed before any student because student_in_section_with_no_leader
+// is only checked once every leader has a section.
+int select_variable(struct assignment * a, struct domain * D, struct domain_state * s, int * degree, int depth, int flags){
+    int var;
+    if (!(flags & MRV_ORDERING)){
+        // The first variable without a section, which is the one at
+        // index depth unless some variables were assigned beforehand.
+        for (var = 0; var < a->total; var++){
+            if (get_section(a, var) < 0)
+                return var;
+        }
+        return depth;
+    }
+
+    int first = 0;
+    int last = a->leaders;
+    if (a->leaders_assigned == a->leaders){
+        first = a->leaders;
+        last = a->total;
+    }
+
+    int remaining;
+    int best = -1;
+    int best_remaining = INT_MAX;
+    for (var = first; var < last; var++){
+        if (get_section(a, var) >= 0)
+            continue;
+        if (s)
+            remaining = domain_size(s, var);
+        else
+            remaining = count_remaining_values(a, D + var, var, best_remaining);
+
+        // A variable with nothing left will fail no matter what, so fail now.
+        if (remaining == 0)
+            return var;
+        if (remaining < best_remaining ||
+            (remaining == best_remaining && *(degree + var) > *(degree + best))){
+            best = var;
+            best_remaining = remaining;
+        }
+    }
+    return best;
+}
 
-    // Temporarily assign the variable
-    set_section(a, var, value);
+// Choose the position in the domain d of the next value to try for var and
+// mark it in tried, the bitset of positions already tried at this depth.
+// Values are tried in domain order, which is the order of preference the
+// caller gave. With LEAST_LOADED a student instead tries the section with the
+// fewest students first, so the first solution found is already close to
+// balanced and branch and bound has a good bound to prune with early.
+// Preference order breaks ties between equally loaded sections, and the
+// section a hint gives the student still goes before all of them.
+int select_value(struct assignment * a, struct domain d, int var, uint64_t * tried, int flags){
+    int i, value, count;
+    int chosen = -1;
+    int fewest = 0;
+    for (i = 0; i < d.size; i++){
+        if (test_bit(tried, i))
+            continue;
+        if (!(flags & LEAST_LOADED) || var < a->leaders){
+            chosen = i;
+            break;
+        }
+        value = *(d.values + i);
+        if (a->hint && value == *(a->hint + var)){
+            chosen = i;
+            break;
+        }
+        count = 0 <= value && value < a->times ? *(a->student_count + value) : 0;
+        if (chosen < 0 || count < fewest){
+            chosen = i;
+            fewest = count;
+        }
+    }
+    set_bit(tried, chosen);
+    return chosen;
+}
 
-    // Check if the assignment generated any inconsistencies
-    int status =  !(a->section_has_more_than_one_leader ||
-                    a->too_few_students_in_a_section ||
-                    a->student_in_section_with_no_leader);
+// Milliseconds on a clock that only moves forward
+long long monotonic_milliseconds(){
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return ((long long) now.tv_sec) * 1000 + now.tv_nsec / 1000000;
+}
 
+int out_of_time(struct incumbent * best){
+    return monotonic_milliseconds() >= best->deadline;
+}
 
-    // Check the binary constraints
-    status &= check_bin_constraints(a, var, value);
+struct incumbent * initialize_incumbent(int total, int * result, long long deadline, solution_callback on_improve){
+    struct incumbent * best = (struct incumbent *) malloc(sizeof(struct incumbent));
+    best->total = total;
+    best->result = result;
+    best->cost = DBL_MAX;
+    best->found = 0;
+    best->done = 0;
+    best->deadline = deadline;
+    best->on_improve = on_improve;
+    pthread_mutex_init(&best->lock, NULL);
+    return best;
+}
 
-    // Unassign the variable
-    set_section(a, var, -1);
+void free_incumbent(struct incumbent * best){
+    pthread_mutex_destroy(&best->lock);
+    free(best);
+}
+
+// The cost of the best assignment found so far. It can be read without the
+// lock since a search only uses it to decide what to prune.
+double incumbent_cost(struct incumbent * best){
+    double c;
+    __atomic_load(&best->cost, &c, __ATOMIC_RELAXED);
+    return c;
+}
 
-    // Return 1 for consistent and false otherwise
-    return status;
+// Replace the best assignment with that of a if a costs less and pass it on
+// to the callback. Returns 1 if the incumbent was replaced.
+int offer_solution(struct incumbent * best, struct assignment * a, double c){
+    int improved = 0;
+    pthread_mutex_lock(&best->lock);
+    if (c < best->cost){
+        memcpy(best->result, a->section_assignments, best->total * sizeof(int));
+        __atomic_store(&best->cost, &c, __ATOMIC_RELAXED);
+        __atomic_store_n(&best->found, 1, __ATOMIC_RELAXED);
+        improved = 1;
+        if (best->on_improve)
+            best->on_improve(best->result, best->total, c);
+    }
+    pthread_mutex_unlock(&best->lock);
+    return improved;
 }
 
 // This is a backtracking search that solves a constraint solving problem.  It seeks a consistent
 // and complete solution that minimizes the cost function described above. After the algorithm has
-// run for max_seconds, it will return the best solution found up to that point (If it found a solution).
-// This implementation does not use any heuristics or inference techniques to speed up search.
-int backtracking_search(struct assignment * a, struct domain * D, int * result, int max_seconds){
-    time_t time_limit = time(NULL) + ((time_t)max_seconds);
-    double upper_bound = DBL_MAX;
-    int found_solution = 0;
+// run until best->deadline, it will return the best solution found up to that point (If it found a solution).
+// The order in which variables are assigned is chosen by select_variable according to flags. With
+// FORWARD_CHECKING every assignment prunes the domains of the unassigned variables (see propagation.c)
+// so that dead ends are found as soon as some domain is wiped out. With BRANCH_AND_BOUND, once a
+// solution is known any branch whose lower_bound is no better than it is abandoned. With STUDENT_FLOW
+// only the leaders are searched over and the students are placed by flow_students (see flow.c). With
+// SYMMETRY_BREAKING only one ordering of interchangeable leaders and sections is tried (see symmetry.c).
+// With BACKJUMPING a dead end jumps back to the deepest variable that caused it, and with
+// NOGOOD_LEARNING the causes are remembered for other branches (see backjumping.c). Values are
+// tried in the order chosen by select_value.
+//
+// Solutions are offered to the incumbent, which may be shared with other searches running at the
+// same time (see portfolio.c). Their solutions tighten the bound used for pruning here, and the
+// search stops early once another search has set best->done. A search that runs out of branches
+// has proven the incumbent optimal and sets best->done itself. If node_limit is not 0 the search
+// also gives up after that many nodes without setting best->done (see restarts.c).
+//
+// Variables that already have a section in a when the search starts stay fixed and only the others
+// are searched over (see repair.c). STUDENT_FLOW and SYMMETRY_BREAKING need every variable free.
+int backtracking_search(struct assignment * a, struct domain * D, struct incumbent * best, int flags, long node_limit){
+    double upper_bound = incumbent_cost(best);
+    long nodes = 0;
+    int flowed = 0;
     int n = a->total;
-    int var, val, advance;
+    int depth, var, val, advance, ok, leaf, target, k, size;
+
+    // The number of variables left to assign
+    int free_vars = n - a->leaders_assigned - a->students_assigned;
+
+    if (n == 0)
+        return 0;
+
+    // Nothing to search for if everything was assigned beforehand
+    if (free_vars == 0){
+        if (!a->section_has_more_than_one_leader && !a->too_few_students_in_a_section &&
+            !a->student_in_section_with_no_leader)
+            offer_solution(best, a, cost(a));
+        __atomic_store_n(&best->done, 1, __ATOMIC_RELAXED);
+        return __atomic_load_n(&best->found, __ATOMIC_RELAXED);
+    }
 
-    // Make an array for tracking the positions in each domain
+    // The variable assigned at each depth of the search along with
+    // the position reached in that variable's domain.
+    int order[n];
     int domain_pos[n];
     zeros(domain_pos, n);
 
-    var = 0;
-    while (0 <= var && var < n){
-        advance = 0;
+    int degree[n];
+    count_degrees(a, degree);
+    find_forbidden_sections(a, D);
+    if (flags & SYMMETRY_BREAKING)
+        find_symmetries(a, D);
 
-        /*
-        int status = !(a->section_has_more_than_one_leader ||
-                    a->too_few_students_in_a_section ||
-                    a->student_in_section_with_no_leader);
-        if (!status){
-            printf("SOMETHING IS WRONG\n");
-            print_assignment(a);
-            exit(1);
+    // The size of the trail before each depth made its assignment
+    int trail_mark[n];
+
+    // The positions of the domain each depth has tried so far
+    int longest = 0;
+    for (k = 0; k < n; k++){
+        if ((D + k)->size > longest)
+            longest = (D + k)->size;
+    }
+    int position_words = (longest + 63) / 64;
+    uint64_t * tried = (uint64_t *) calloc(n * position_words + 1, sizeof(uint64_t));
+
+    // With BACKJUMPING the conflict set of each depth and the depth each
+    // variable was assigned at
+    int words = (n + 63) / 64;
+    uint64_t * conflicts = NULL;
+    int * depth_of = NULL;
+    struct nogood_cache * nogoods = NULL;
+    if (flags & BACKJUMPING){
+        conflicts = (uint64_t *) calloc(n * words, sizeof(uint64_t));
+        depth_of = (int *) malloc(n * sizeof(int));
+        for (k = 0; k < n; k++){
+            *(depth_of + k) = -1;
         }
-        */
+        if (flags & NOGOOD_LEARNING)
+            nogoods = initialize_nogood_cache(n, a->times);
+    }
+    int nogood_vars[NOGOOD_SIZE];
+    int nogood_values[NOGOOD_SIZE];
+
+    struct domain_state * s = NULL;
+    if (flags & FORWARD_CHECKING){
+        s = initialize_domain_state(a, D);
+        ok = propagate_initial(s);
+
+        // Variables assigned beforehand prune the domains before the search starts
+        for (var = 0; ok && var < n; var++){
+            if (get_section(a, var) >= 0)
+                ok = is_live(s, var, get_section(a, var)) && propagate(s, var, get_section(a, var));
+        }
+        if (!ok){
+            free_domain_state(s);
+            free(tried);
+            free(conflicts);
+            free(depth_of);
+            if (nogoods)
+                free_nogood_cache(nogoods);
+            __atomic_store_n(&best->done, 1, __ATOMIC_RELAXED);
+            return __atomic_load_n(&best->found, __ATOMIC_RELAXED);
+        }
+    }
+
+    depth = 0;
+    *order = select_variable(a, D, s, degree, depth, flags);
+    if (conflicts)
+        memset(conflicts, 0, words * sizeof(uint64_t));
+    while (0 <= depth && depth < n){
+        advance = 0;
+        var = *(order + depth);
+
+        // Pick up better solutions found by other searches
+        upper_bound = incumbent_cost(best);
 
         // Get the domain for this variable
         struct domain d = *(D + var);
 
         // While the domain is not empty
-        while (*(domain_pos + var) < d.size){
+        while (*(domain_pos + depth) < d.size){
 
             // Get the next value in the domain
-            val = *(d.values + *(domain_pos + var));
-            *(domain_pos + var) += 1;
+            val = *(d.values + select_value(a, d, var, tried + depth * position_words, flags));
+            *(domain_pos + depth) += 1;
+
+            // Skip values that have already been pruned
+            if (s && !is_live(s, var, val)){
+                if (conflicts)
+                    explain_removal(s, var, val, conflicts + depth * words, depth);
+                continue;
+            }
 
             // Check if the the selected value would
             // make a consitent assignment.
-            if (is_consistent(a, var, val)) {
+            if (!is_consistent(a, var, val)){
+                if (conflicts)
+                    explain_inconsistency(a, var, val, depth_of, conflicts + depth * words, depth);
+                continue;
+            }
+            if (nogoods && nogood_conflict(nogoods, a, var, val, depth_of, conflicts + depth * words))
+                continue;
 
-                // Make the assignment and advance
-                set_section(a, var, val);
-                var++;
+            // Make the assignment and prune the other domains
+            set_section(a, var, val);
+            ok = 1;
+            if (s){
+                *(trail_mark + depth) = s->trail_size;
+                s->depth = depth;
+                ok = propagate(s, var, val);
+                if (!ok && conflicts)
+                    explain_wipeout(s, D, conflicts + depth * words, depth);
+            }
 
-                // Restore the domain of the next variable
-                *(domain_pos + var) = 0;
-                advance = 1;
-                break;
+            // Give up on the branch if it cannot beat the best assignment so far.
+            // The constant time bound is tried before the tighter one.
+            if (ok && upper_bound < DBL_MAX && (flags & BRANCH_AND_BOUND)){
+                ok = excess_bound(a) < upper_bound - COST_EPSILON &&
+                     lower_bound(a) < upper_bound - COST_EPSILON;
+                if (!ok && conflicts)
+                    add_all_below(conflicts + depth * words, depth);
             }
+
+            if (!ok){
+                if (s)
+                    undo_trail(s, *(trail_mark + depth));
+                set_section(a, var, -1);
+                continue;
+            }
+            if (depth_of)
+                *(depth_of + var) = depth;
+            depth++;
+
+            // With STUDENT_FLOW the students are placed all at once by a
+            // min cost flow as soon as the last leader has a section.
+            leaf = depth >= free_vars || ((flags & STUDENT_FLOW) && a->leaders_assigned == a->leaders);
+
+            // Pick the next variable and start at the beginning of its domain
+            if (!leaf){
+                *(order + depth) = select_variable(a, D, s, degree, depth, flags);
+                *(domain_pos + depth) = 0;
+                memset(tried + depth * position_words, 0, position_words * sizeof(uint64_t));
+                if (conflicts)
+                    memset(conflicts + depth * words, 0, words * sizeof(uint64_t));
+            }
+            advance = 1;
+            break;
         }
 
-        // Backtrack
+        // Backtrack. With BACKJUMPING go straight back to the deepest
+        // variable in the conflict set, passing the rest of the set on to it.
         if (!advance){
-            var--;
-	       if (var >= 0)
-            	set_section(a, var, -1);
-        }   
-        // If the variable is greater then n then we have found a solution.
+            target = depth - 1;
+            if (conflicts){
+                uint64_t * conflict = conflicts + depth * words;
+                target = highest_bit(conflict, words);
+
+                // The assignments in the conflict set cannot all be made again
+                if (nogoods && count_bits(conflict, words) <= NOGOOD_SIZE){
+                    size = 0;
+                    for (k = 0; k < depth; k++){
+                        if (test_bit(conflict, k)){
+                            *(nogood_vars + size) = *(order + k);
+                            *(nogood_values + size) = get_section(a, *(order + k));
+                            size++;
+                        }
+                    }
+                    learn_nogood(nogoods, nogood_vars, nogood_values, size);
+                }
+                if (target >= 0){
+                    for (k = 0; k < words; k++){
+                        *(conflicts + target * words + k) |= *(conflict + k);
+                    }
+                    *(conflicts + target * words + target / 64) &= ~(((uint64_t) 1) << (target % 64));
+                }
+            }
+            while (depth > target && depth > 0){
+                depth--;
+                set_section(a, *(order + depth), -1);
+                if (depth_of)
+                    *(depth_of + *(order + depth)) = -1;
+            }
+            if (target < 0)
+                depth = -1;
+            else if (s)
+                undo_trail(s, *(trail_mark + depth));
+        }
+        // If every variable has been assigned then we have found a solution.
         else{
-            if (var >= n){
-                found_solution = 1;
-                double c = cost(a);
-
-                // Check if this assignment is an improvement over previously found
-                // assignments and save it if it is.
-                if (c < upper_bound){
-                    upper_bound = c;
-                    memcpy(result, a->section_assignments, n * sizeof(int));
+            if (leaf){
+
+                // Save the assignment if it is an improvement over previously found assignments.
+                if (depth >= free_vars)
+                    offer_solution(best, a, cost(a));
+                else{
+                    flowed = 1;
+                    if (flow_students(a, D, s)){
+                        offer_solution(best, a, cost(a));
+                        unassign_students(a);
+                    }
                 }
 
+                // Local search takes over from the first solution
+                if ((flags & LOCAL_SEARCH) && __atomic_load_n(&best->found, __ATOMIC_RELAXED))
+                    __atomic_store_n(&best->done, 1, __ATOMIC_RELAXED);
+
                 // Continue searching for other assignments by backtracking.
-                var--;
-                set_section(a, var, -1);
+                // Which solutions are left to beat depends on every variable.
+                depth--;
+                if (s)
+                    undo_trail(s, *(trail_mark + depth));
+                set_section(a, *(order + depth), -1);
+                if (conflicts){
+                    *(depth_of + *(order + depth)) = -1;
+                    add_all_below(conflicts + depth * words, depth);
+                }
             }
         }
 
-        // Check if the algorithm has been running for 
-        // longer than the specified time limit and break out 
-        // of the while loop if time is up.
-        if (time(NULL) > time_limit){
+        // Stop if another search has finished
+        if (__atomic_load_n(&best->done, __ATOMIC_RELAXED))
+            break;
+
+        // Every so often check if the algorithm has been running
+        // for longer than the specified time limit and break out
+        // of the while loop if time is up. A single flow can take
+        // longer than NODES_PER_CHECK nodes so the clock is also
+        // checked after every one.
+        nodes++;
+        if ((flowed || nodes % NODES_PER_CHECK == 0) && out_of_time(best)){
             printf("Reached Time Limit\n");
+            __atomic_store_n(&best->done, 1, __ATOMIC_RELAXED);
             break;
         }
+        flowed = 0;
+        if (node_limit && nodes >= node_limit)
+            break;
     }
 
+    // Running out of branches proves that nothing beats the incumbent
+    if (depth < 0)
+        __atomic_store_n(&best->done, 1, __ATOMIC_RELAXED);
+
+    if (s)
+        free_domain_state(s);
+    free(tried);
+    free(conflicts);
+    free(depth_of);
+    if (nogoods)
+        free_nogood_cache(nogoods);
+
     // Inform the caller whether or not a solution was found. 1 for true 0 otherwise.
-    return found_solution;
+    return __atomic_load_n(&best->found, __ATOMIC_RELAXED);
 }
@@ -0,0 +1,170 @@
+#include "assign_students.h"
+
+// Once every leader has a section, placing the students so that the sections
+// are as balanced as possible is a min cost flow problem: each student sends
+// one unit of flow to a section it may attend and each section passes its
+// flow on to the sink. The size error of a section is convex in its number of
+// students, so the cost of the k-th unit into a section is the increase in
+// its squared error, and these increase with k. Every section with a leader
+// needs at least one student, which is enforced by making the first unit into
+// a section so cheap that the flow fills every section it can.
+//
+// The flow is built up one student at a time. Moving students between sections
+// along the assignment arcs costs nothing, so the shortest augmenting path for
+// a new student ends at the cheapest section it can reach through a chain of
+// students each moving into another section they may attend. Augmenting along
+// shortest paths keeps the flow optimal for the students added so far.
+//
+// The gender and preference terms of the cost are not part of the flow, so the
+// size balance is optimal for the placement of the leaders but the total cost
+// may not be.
+
+// Whether a student may be placed in a section once all the leaders are placed
+int student_can_take(struct assignment * a, struct domain_state * s, int var, int section){
+    if (s)
+        return is_live(s, var, section);
+    if (!*(a->has_leader + section))
+        return 0;
+    if (a->forbidden_sections && test_bit(a->forbidden_sections + var * a->section_words, section))
+        return 0;
+    return check_bin_constraints(a, var, section);
+}
+
+// The increase in the scaled size error of a section (see update_section_cost)
+// from giving it one more student, divided by the number of leaders. The first
+// student of a section is worth big so that no section is left empty.
+long long marginal_cost(struct assignment * a, int count, long long big){
+    if (!count)
+        return -big;
+    return ((long long) a->leaders) * (2 * count + 1) - 2 * ((long long) a->students);
+}
+
+// Place every student with a min cost flow, given that all of the leaders have
+// a section and no student does. Returns 1 and leaves the students assigned in
+// a if every student could be placed without leaving a section empty, and
+// returns 0 leaving a untouched otherwise.
+int flow_students(struct assignment * a, struct domain * D, struct domain_state * s){
+    int total = a->total;
+    int times = a->times;
+    int u, x, i, t, next_section, head_pos, tail_pos, best_section;
+    long long best_cost, c;
+
+    // Larger than any sum of the other marginal costs
+    long long big = ((long long) a->students) * (((long long) a->leaders) * (2 * a->students + 1) + 2 * a->students) + 1;
+
+    // The flow so far as a section for each student, with the students
+    // in each section kept in a doubly linked list.
+    int where[total];
+    int next[total];
+    int prev[total];
+    int head[times];
+    int count[times];
+    for (i = 0; i < total; i++){
+        *(where + i) = -1;
+    }
+    for (t = 0; t < times; t++){
+        *(head + t) = -1;
+        *(count + t) = 0;
+    }
+
+    // Breadth first search state: the student that moves into each reached section
+    int parent[times];
+    int queue[times];
+
+    for (u = a->leaders; u < total; u++){
+        for (t = 0; t < times; t++){
+            *(parent + t) = -1;
+        }
+        head_pos = 0;
+        tail_pos = 0;
+        best_section = -1;
+        best_cost = 0;
+
+        // Start from the sections the new student can take directly
+        struct domain d = *(D + u);
+        for (i = 0; i < d.size; i++){
+            t = *(d.values + i);
+            if (0 <= t && t < times && *(parent + t) < 0 && student_can_take(a, s, u, t)){
+                *(parent + t) = u;
+                *(queue + tail_pos) = t;
+                tail_pos++;
+            }
+        }
+
+        while (head_pos < tail_pos){
+            t = *(queue + head_pos);
+            head_pos++;
+
+            c = marginal_cost(a, *(count + t), big);
+            if (best_section < 0 || c < best_cost){
+                best_section = t;
+                best_cost = c;
+            }
+
+            // Nothing is cheaper than filling an empty section
+            if (!*(count + t))
+                break;
+
+            // Follow the students in this section to the other sections they can take
+            for (x = *(head + t); x >= 0; x = *(next + x)){
+                struct domain dx = *(D + x);
+                for (i = 0; i < dx.size; i++){
+                    next_section = *(dx.values + i);
+                    if (0 <= next_section && next_section < times && *(parent + next_section) < 0 &&
+                        student_can_take(a, s, x, next_section)){
+                        *(parent + next_section) = x;
+                        *(queue + tail_pos) = next_section;
+                        tail_pos++;
+                    }
+                }
+            }
+        }
+
+        if (best_section < 0)
+            return 0;
+
+        // Shift the students along the path back to the new student
+        *(count + best_section) += 1;
+        t = best_section;
+        while (1){
+            x = *(parent + t);
+            int old = *(where + x);
+            if (old >= 0){
+                if (*(prev + x) >= 0)
+                    *(next + *(prev + x)) = *(next + x);
+                else
+                    *(head + old) = *(next + x);
+                if (*(next + x) >= 0)
+                    *(prev + *(next + x)) = *(prev + x);
+            }
+            *(where + x) = t;
+            *(prev + x) = -1;
+            *(next + x) = *(head + t);
+            if (*(head + t) >= 0)
+                *(prev + *(head + t)) = x;
+            *(head + t) = x;
+            if (x == u)
+                break;
+            t = old;
+        }
+    }
+
+    // Every section with a leader needs a student
+    for (t = 0; t < times; t++){
+        if (*(a->has_leader + t) && !*(count + t))
+            return 0;
+    }
+
+    for (u = a->leaders; u < total; u++){
+        set_section(a, u, *(where + u));
+    }
+    return 1;
+}
+
+// Take the students back out of their sections
+void unassign_students(struct assignment * a){
+    int var;
+    for (var = a->leaders; var < a->total; var++){
+        set_section(a, var, -1);
+    }
+}
@@ -0,0 +1,185 @@
+#include "assign_students.h"
+#include <math.h>
+
+// Local search that improves a complete assignment by simulated annealing.
+// Three kinds of moves are tried at random: moving a student to another
+// section, swapping the sections of two students and swapping the sections
+// of two leaders. A move is only made if the assignment stays consistent, so
+// the search never leaves the space of valid assignments. Since set_section
+// keeps the cost terms up to date each move is scored in constant time. Moves
+// that make things worse are accepted with a probability that shrinks as the
+// temperature is lowered over the time budget.
+
+#define START_TEMPERATURE 4.0
+#define END_TEMPERATURE 0.01
+
+// How many moves are tried between looks at the clock
+#define MOVES_PER_CHECK 1024
+
+// Whether every student in a section could have the given leader
+int students_can_have_leader(struct assignment * a, int section, int leader){
+    int var;
+    for (var = a->leaders; var < a->total; var++){
+        if (get_section(a, var) == section && test_bit(a->cant_be_with + var * a->leader_words, leader))
+            return 0;
+    }
+    return 1;
+}
+
+// Move a random student to another random section in its domain. Returns 1
+// and records the undo information in moved if the move was made.
+int move_student(struct assignment * a, struct domain * D, uint64_t * allowed, unsigned int * state, int * moved){
+    int var = a->leaders + next_random(state) % a->students;
+    struct domain d = *(D + var);
+    if (!d.size)
+        return 0;
+    int from = get_section(a, var);
+    int to = *(d.values + next_random(state) % d.size);
+    if (to == from || !*(a->has_leader + to) || *(a->student_count + from) < 2 ||
+        !test_bit(allowed + var * a->section_words, to) || !check_bin_constraints(a, var, to))
+        return 0;
+    set_section(a, var, -1);
+    set_section(a, var, to);
+    *moved = var;
+    *(moved + 1) = from;
+    *(moved + 2) = -1;
+    return 1;
+}
+
+// Swap the sections of two random variables, both leaders or both students
+int swap_sections(struct assignment * a, uint64_t * allowed, unsigned int * state, int leaders, int * moved){
+    int first = leaders ? 0 : a->leaders;
+    int count = leaders ? a->leaders : a->students;
+    if (count < 2)
+        return 0;
+    int x = first + next_random(state) % count;
+    int y = first + next_random(state) % count;
+    int sx = get_section(a, x);
+    int sy = get_section(a, y);
+    if (sx == sy || !test_bit(allowed + x * a->section_words, sy) || !test_bit(allowed + y * a->section_words, sx))
+        return 0;
+    if (leaders){
+        if (!students_can_have_leader(a, sx, y) || !students_can_have_leader(a, sy, x))
+            return 0;
+    }
+    else{
+        if (test_bit(a->cant_be_with + x * a->leader_words, *(a->section_leader + sy)) ||
+            test_bit(a->cant_be_with + y * a->leader_words, *(a->section_leader + sx)))
+            return 0;
+    }
+    set_section(a, x, -1);
+    set_section(a, y, -1);
+    set_section(a, x, sy);
+    set_section(a, y, sx);
+    *moved = x;
+    *(moved + 1) = sx;
+    *(moved + 2) = y;
+    *(moved + 3) = sy;
+    return 1;
+}
+
+// Put back the variables changed by the last move
+void undo_move(struct assignment * a, int * moved){
+    set_section(a, *moved, -1);
+    if (*(moved + 2) >= 0)
+        set_section(a, *(moved + 2), -1);
+    set_section(a, *moved, *(moved + 1));
+    if (*(moved + 2) >= 0)
+        set_section(a, *(moved + 2), *(moved + 3));
+}
+
+// Offer the given complete assignment to the incumbent. The working
+// assignment a is left unchanged.
+void offer_assignment(struct incumbent * best, struct assignment * a, int * assignment){
+    struct assignment * copy = initialize_assignment(a->total, a->leaders, a->times, a->genders, a->bin_constraints, a->weights, a->rank, a->hint);
+    int var;
+    for (var = 0; var < a->total; var++){
+        set_section(copy, var, *(assignment + var));
+    }
+    offer_solution(best, copy, cost(copy));
+    free_assignment(copy);
+}
+
+// Improve the incumbent by simulated annealing for max_milliseconds. Does
+// nothing if no assignment has been found yet. Improvements are handed to
+// the incumbent as they are found, at most once per MOVES_PER_CHECK moves.
+void improve_assignment(struct problem * p, struct incumbent * best, int max_milliseconds, unsigned int seed){
+    if (!best->found || max_milliseconds <= 0 || p->leaders == 0 || p->total == p->leaders)
+        return;
+
+    struct assignment * a = initialize_assignment(p->total, p->leaders, p->times, p->genders, p->bin_constraints, p->weights, p->rank, p->hint);
+    int n = p->total;
+    int var, i;
+    for (var = 0; var < n; var++){
+        set_section(a, var, *(best->result + var));
+    }
+
+    // The domains as bitsets for quick membership tests
+    uint64_t * allowed = (uint64_t *) calloc(n * a->section_words + 1, sizeof(uint64_t));
+    for (var = 0; var < n; var++){
+        struct domain d = *(p->D + var);
+        for (i = 0; i < d.size; i++){
+            if (0 <= *(d.values + i) && *(d.values + i) < p->times)
+                set_bit(allowed + var * a->section_words, *(d.values + i));
+        }
+    }
+
+    unsigned int state = seed ? seed : 1;
+    int moved[4];
+    int made, kind;
+    double current = cost(a);
+    double lowest = current;
+    double temperature = START_TEMPERATURE;
+    double elapsed, change;
+    double offered = current;
+    long moves = 0;
+    int * lowest_assignment = (int *) malloc(n * sizeof(int));
+    memcpy(lowest_assignment, a->section_assignments, n * sizeof(int));
+
+    long long start = monotonic_milliseconds();
+    while (1){
+        if (moves % MOVES_PER_CHECK == 0){
+            elapsed = (double) (monotonic_milliseconds() - start);
+            if (elapsed >= max_milliseconds)
+                break;
+            temperature = START_TEMPERATURE * pow(END_TEMPERATURE / START_TEMPERATURE, elapsed / max_milliseconds);
+
+            // Report the best assignment so far if it has improved
+            if (lowest < offered - COST_EPSILON){
+                offer_assignment(best, a, lowest_assignment);
+                offered = lowest;
+            }
+        }
+        moves++;
+
+        // Mostly student moves, some student swaps and a few leader swaps
+        kind = next_random(&state) % 100;
+        if (kind < 60)
+            made = move_student(a, p->D, allowed, &state, moved);
+        else if (kind < 95)
+            made = swap_sections(a, allowed, &state, 0, moved);
+        else
+            made = swap_sections(a, allowed, &state, 1, moved);
+        if (!made)
+            continue;
+
+        change = cost(a) - current;
+        if (change <= 0 || next_random(&state) / 4294967296.0 < exp(-change / temperature)){
+            current = cost(a);
+            if (current < lowest - COST_EPSILON){
+                lowest = current;
+                memcpy(lowest_assignment, a->section_assignments, n * sizeof(int));
+            }
+        }
+        else
+            undo_move(a, moved);
+    }
+
+    // Hand the best assignment seen back to the incumbent
+    if (lowest < offered - COST_EPSILON)
+        offer_assignment(best, a, lowest_assignment);
+
+    free(lowest_assignment);
+    free(allowed);
+    free_assignment(a);
+}
@@ -1,4 +1,5 @@
 #include "assign_students.h"
+#include <float.h>
 #include <time.h>
 
 void swap(int i, int j, int * a){
@@ -179,8 +180,8 @@ void pretty_print_result(int * a, int total, int leaders, int * genders){
 }
 
 int main(int argc, char * argv[]){
-    if(argc != 5){
-        printf("usage: $ ./testing [Total # of students (including leaders)] [# of section leaders] [# of possible times] [max time in seconds]\n");
+    if(argc < 5 || argc > 9){
+        printf("usage: $ ./testing [Total # of students (including leaders)] [# of section leaders] [# of possible times] [max time in seconds] [search flags] [threads] [local search seconds] [seed]\n");
         exit(1);
     }
     srand(time(NULL)); 
@@ -188,6 +189,10 @@ int main(int argc, char * argv[]){
     int leaders = atoi(argv[2]);
     int times = atoi(argv[3]);
     int max_time = atoi(argv[4]);
+    int flags = argc >= 6 ? atoi(argv[5]) : 0;
+    int threads = argc >= 7 ? atoi(argv[6]) : 1;
+    int improve_time = argc >= 8 ? atoi(argv[7]) : 0;
+    unsigned int seed = argc >= 9 ? (unsigned int) atoi(argv[8]) : 0;
     //struct domain * D = generate_random_domain(10, 6);
     struct domain * D = generate_random_domain(total, times);
     //struct domain * D = make_trivial_domain3(total, leaders, times);
@@ -198,7 +203,7 @@ int main(int argc, char * argv[]){
     print_domains(D, total);
     printf("Restrictions:\n");
     print_domains(restrictions, total);
-    int * a = assign_students(D, total, leaders, times, genders, restrictions, max_time);
+    int * a = assign_students(D, total, leaders, times, genders, restrictions, max_time * 1000, flags, threads, improve_time * 1000, NULL, seed, NULL, NULL, DBL_MAX, NULL);
     int i;
     printf("Results:\n");
     for (i = 0; i < total; i++){
@@ -211,6 +216,6 @@ int main(int argc, char * argv[]){
     free_domain_ptr(D, total);
     free_domain_ptr(restrictions, total);
     free(genders);
-    free(a);
+    free_result(a);
 
 }
@@ -0,0 +1,308 @@
+# A solver written in Python with NumPy, used by assign_students when the C
+# library has not been built. It takes the flat arrays made by
+# generate_availability_problem and has the same cost as the C solver (see
+# cost in backtracking.c), but rather than searching every assignment it
+# builds one greedily and improves it by local search. The cost change of
+# every student move and of every swap of two leaders is worked out at once
+# as an array, and the best one is made until none of them helps.
+#
+# Local search cannot prove that an assignment is optimal or that there is
+# none, so it keeps perturbing the best assignment and starting afresh until
+# max_time is up or STALE_STARTS starts in a row have not improved on it.
+
+import random
+import time
+
+import numpy
+
+# How many starts in a row may fail to improve the best assignment
+STALE_STARTS = 100
+
+# Every this many starts the assignment is built afresh instead of perturbing
+# the best one
+FRESH_EVERY = 2
+
+# How many times to try placing the leaders in a fresh start
+LEADER_TRIES = 50
+
+# Slack used when comparing costs against each other
+COST_EPSILON = 1e-9
+
+# The gender cost of sections with the given numbers of students and women,
+# where the women include the leader (see section_gender_error in assignment.c)
+def gender_errors(counts, females):
+    males = counts - females
+    diff = numpy.abs(males - females)
+    return numpy.where((diff <= 1) | (females == 0) | (males == 0), 0, diff * diff)
+
+class Problem(object):
+    # The problem as arrays, with allowed[i, t] saying whether section t is
+    # in the domain of variable i, rank[i, t] how far down the preferences of
+    # i it is and cant[s, l] whether student s, counting from the first
+    # student, cannot be with leader l
+    def __init__(self, domain_offsets, domain_values, leaders, times, genders, constraint_offsets, constraint_values, weights):
+        domain_offsets = numpy.array(domain_offsets, dtype=int)
+        domain_values = numpy.array(domain_values, dtype=int)
+        constraint_offsets = numpy.array(constraint_offsets, dtype=int)
+        constraint_values = numpy.array(constraint_values, dtype=int)
+        n = len(domain_offsets) - 1
+        self.leader_domains = [domain_values[domain_offsets[l]:domain_offsets[l + 1]].tolist() for l in range(leaders)]
+        self.n = n
+        self.leaders = leaders
+        self.students = n - leaders
+        self.times = times
+        self.genders = numpy.array(genders, dtype=int)
+        self.weights = weights
+        self.mean = float(self.students) / leaders
+
+        # The variable of each value and its position in the variable's
+        # domain. Values are set from the back so that the first time a
+        # section appears in a domain gives its rank.
+        rows = numpy.repeat(numpy.arange(n), numpy.diff(domain_offsets))
+        positions = numpy.arange(len(domain_values)) - domain_offsets[rows]
+        keep = ((0 <= domain_values) & (domain_values < times))[::-1]
+        self.allowed = numpy.zeros((n, times), dtype=bool)
+        self.rank = numpy.zeros((n, times), dtype=int)
+        self.allowed[rows[::-1][keep], domain_values[::-1][keep]] = True
+        self.rank[rows[::-1][keep], domain_values[::-1][keep]] = positions[::-1][keep]
+
+        rows = numpy.repeat(numpy.arange(n), numpy.diff(constraint_offsets))
+        keep = (rows >= leaders) & (0 <= constraint_values) & (constraint_values < leaders)
+        self.cant = numpy.zeros((self.students, leaders), dtype=bool)
+        self.cant[rows[keep] - leaders, constraint_values[keep]] = True
+
+    def options(self, led):
+        # The sections each student can be in once the leaders are in the
+        # sections led
+        leader_at = numpy.full(self.times, -1, dtype=int)
+        leader_at[led] = numpy.arange(self.leaders)
+        has_leader = leader_at >= 0
+        excluded = self.cant[:, numpy.maximum(leader_at, 0)] & has_leader
+        return self.allowed[self.leaders:] & has_leader & ~excluded
+
+    def cost(self, assignment):
+        led = assignment[:self.leaders]
+        counts = numpy.bincount(assignment[self.leaders:], minlength=self.times)
+        females = numpy.bincount(assignment, weights=self.genders, minlength=self.times).astype(int)
+        size = ((counts[led] - self.mean) ** 2).sum()
+        gender = gender_errors(counts, females)[led].sum()
+        preference = self.rank[numpy.arange(self.n), assignment].sum()
+        return (self.weights['size'] * size + self.weights['gender'] * gender +
+                self.weights['preference'] * preference)
+
+    def is_valid(self, assignment):
+        # Whether a complete assignment meets every constraint
+        if (assignment < 0).any() or (assignment >= self.times).any():
+            return False
+        led = assignment[:self.leaders]
+        if len(set(led)) < self.leaders or not self.allowed[numpy.arange(self.n), assignment].all():
+            return False
+        students = assignment[self.leaders:]
+        if not self.options(led)[numpy.arange(self.students), students].all():
+            return False
+        return (numpy.bincount(students, minlength=self.times)[led] > 0).all()
+
+def augment(start, choices, holder, seen):
+    # Find room for start by an augmenting path, where choices gives the
+    # places each one can take in the order to try them and holder who is in
+    # each place
+    for place in choices(start):
+        if place in seen:
+            continue
+        seen.add(place)
+        if holder[place] < 0 or augment(holder[place], choices, holder, seen):
+            holder[place] = start
+            return True
+    return False
+
+def build(problem, rng, hint, shuffle):
+    # Build an assignment from scratch, trying the hinted sections first and
+    # then the preferred ones, or every choice in a random order with
+    # shuffle. Returns None if no leader placement worked.
+    L = problem.leaders
+    for attempt in range(LEADER_TRIES):
+        def leader_choices(l):
+            d = list(problem.leader_domains[l])
+            if shuffle or attempt:
+                rng.shuffle(d)
+            if hint is not None and hint[l] in d:
+                d.remove(hint[l])
+                d.insert(0, hint[l])
+            return [t for t in d if 0 <= t < problem.times]
+        holder = [-1] * problem.times
+        order = list(range(L))
+        if shuffle or attempt:
+            rng.shuffle(order)
+        if not all(augment(l, leader_choices, holder, set()) for l in order):
+            return None
+        led = numpy.zeros(L, dtype=int)
+        for t in range(problem.times):
+            if holder[t] >= 0:
+                led[holder[t]] = t
+
+        options = problem.options(led)
+        if not options.any(axis=1).all():
+            continue
+
+        # Every section needs a student of its own before the rest are placed
+        members = [numpy.nonzero(options[:, t])[0].tolist() for t in range(problem.times)]
+        for t in led:
+            rng.shuffle(members[t])
+        taker = [-1] * problem.students
+        if not all(augment(t, lambda t: members[t], taker, set()) for t in led):
+            continue
+
+        students = numpy.full(problem.students, -1, dtype=int)
+        for s in range(problem.students):
+            if taker[s] >= 0:
+                students[s] = taker[s]
+        counts = numpy.bincount(students[students >= 0], minlength=problem.times)
+        rest = [s for s in range(problem.students) if students[s] < 0]
+        rng.shuffle(rest)
+        for s in rest:
+            h = hint[L + s] if hint is not None else -1
+            if 0 <= h < problem.times and options[s, h]:
+                t = h
+            else:
+                candidates = numpy.nonzero(options[s])[0]
+                t = candidates[numpy.lexsort((problem.rank[L + s, candidates], counts[candidates]))[0]]
+            students[s] = t
+            counts[t] += 1
+        return numpy.concatenate((led, students))
+    return None
+
+def perturb(problem, assignment, rng, moves):
+    # Move some random students to other sections they can be in, never
+    # leaving a section empty
+    L = problem.leaders
+    assignment = assignment.copy()
+    options = problem.options(assignment[:L])
+    counts = numpy.bincount(assignment[L:], minlength=problem.times)
+    for i in range(moves):
+        s = rng.randrange(problem.students)
+        candidates = numpy.nonzero(options[s])[0]
+        t = candidates[rng.randrange(len(candidates))]
+        if counts[assignment[L + s]] > 1:
+            counts[assignment[L + s]] -= 1
+            counts[t] += 1
+            assignment[L + s] = t
+    return assignment
+
+def improve(problem, assignment, deadline):
+    # Make the best student move or leader swap until none lowers the cost
+    L = problem.leaders
+    S = problem.students
+    w = problem.weights
+    female = problem.genders[L:] == 1
+    leader_genders = problem.genders[:L]
+    everyone = numpy.arange(S)
+    assignment = assignment.copy()
+    options = problem.options(assignment[:L])
+    counts = numpy.bincount(assignment[L:], minlength=problem.times)
+    females = numpy.bincount(assignment, weights=problem.genders, minlength=problem.times).astype(int)
+
+    while time.time() < deadline:
+        led = assignment[:L]
+        at = assignment[L:]
+        now = gender_errors(counts, females)
+
+        # Moving student s from section a to section t. Sections have one
+        # leader each so the size error changes by 2 (c_t - c_a) + 2.
+        size = 2 * (counts[None, :] - counts[at][:, None]) + 2
+        into = numpy.where(female[:, None], gender_errors(counts + 1, females + 1) - now,
+                           gender_errors(counts + 1, females) - now)
+        out = numpy.where(female, (gender_errors(counts - 1, females - 1) - now)[at],
+                          (gender_errors(counts - 1, females) - now)[at])
+        preference = problem.rank[L:] - problem.rank[L + everyone, at][:, None]
+        moves = w['size'] * size + w['gender'] * (into + out[:, None]) + w['preference'] * preference
+        moves = numpy.where(options & (counts[at] > 1)[:, None], moves, numpy.inf)
+        moves[everyone, at] = numpy.inf
+        move = numpy.unravel_index(numpy.argmin(moves), moves.shape)
+        move_change = moves[move]
+
+        # Swapping the sections of leaders i and j, which only changes the
+        # genders and preferences. can_take[i, j] says whether i may lead
+        # the section of j and its students.
+        swap_change = numpy.inf
+        if L > 1:
+            section_of = numpy.full(problem.times, -1, dtype=int)
+            section_of[led] = numpy.arange(L)
+            in_section = numpy.zeros((S, L), dtype=int)
+            in_section[everyone, section_of[at]] = 1
+            blocked = problem.cant.T.astype(int).dot(in_section) > 0
+            can_take = problem.allowed[:L][:, led] & ~blocked
+            swaps_ok = can_take & can_take.T
+            numpy.fill_diagonal(swaps_ok, False)
+            shift = leader_genders[None, :] - leader_genders[:, None]
+            gained = gender_errors(counts[led][:, None], females[led][:, None] + shift) - now[led][:, None]
+            gender = gained + gained.T
+            ranks = problem.rank[:L][:, led]
+            preference = ranks + ranks.T - numpy.diag(ranks)[:, None] - numpy.diag(ranks)[None, :]
+            swaps = numpy.where(swaps_ok, w['gender'] * gender + w['preference'] * preference, numpy.inf)
+            swap = numpy.unravel_index(numpy.argmin(swaps), swaps.shape)
+            swap_change = swaps[swap]
+
+        if min(move_change, swap_change) >= -COST_EPSILON:
+            break
+        if move_change <= swap_change:
+            s, t = move
+            a = at[s]
+            counts[a] -= 1
+            counts[t] += 1
+            females[a] -= female[s]
+            females[t] += female[s]
+            assignment[L + s] = t
+        else:
+            i, j = swap
+            si, sj = led[i], led[j]
+            females[si] += leader_genders[j] - leader_genders[i]
+            females[sj] += leader_genders[i] - leader_genders[j]
+            assignment[i], assignment[j] = sj, si
+            options = problem.options(assignment[:L])
+    return assignment
+
+def solve(domain_offsets, domain_values, leaders, times, genders, constraint_offsets, constraint_values, max_time, weights, seed=0, hint=None, upper_bound=None, on_improve=None):
+    '''
+    Solve the problem in max_time seconds and return a list with the section
+    of every variable, all -1 if no assignment costing less than upper_bound
+    was found. hint may give a section or -1 for each variable to try first,
+    and on_improve is called with each better assignment and its cost.
+    '''
+    n = len(domain_offsets) - 1
+    if leaders == 0:
+        return [-1] * n
+    deadline = time.time() + max_time
+    problem = Problem(domain_offsets, domain_values, leaders, times, genders, constraint_offsets, constraint_values, weights)
+    rng = random.Random(seed)
+    best = None
+    best_cost = float('inf') if upper_bound is None else upper_bound
+
+    current = None
+    if hint is not None:
+        hint = list(hint)
+        if problem.is_valid(numpy.array(hint, dtype=int)):
+            current = numpy.array(hint, dtype=int)
+
+    start = stale = 0
+    while stale < STALE_STARTS and time.time() < deadline:
+        if current is None:
+            if best is not None and start % FRESH_EVERY:
+                current = perturb(problem, best, rng, max(2, problem.students // 20))
+            else:
+                current = build(problem, rng, hint if start == 0 else None, start > 0)
+        start += 1
+        stale += 1
+        if current is None:
+            continue
+        current = improve(problem, current, deadline)
+        c = problem.cost(current)
+        if c < best_cost - COST_EPSILON:
+            best, best_cost = current, c
+            stale = 0
+            if on_improve is not None:
+                on_improve(best.tolist(), float(best_cost))
+        current = None
+
+    if best is None:
+        return [-1] * n
+    return best.tolist()
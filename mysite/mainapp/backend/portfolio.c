@@ -0,0 +1,123 @@
+#include "assign_students.h"
+
+// Portfolio search. Several backtracking searches with different variable and
+// value orderings run on their own threads and share one incumbent, so the
+// solutions any of them finds tighten the bound the others prune with. The
+// portfolio ends when one search exhausts its tree, which proves the incumbent
+// optimal, or when time runs out.
+
+// The arguments for one thread of the portfolio
+struct portfolio_job{
+    struct problem * p;
+    struct incumbent * best;
+    int flags;
+    unsigned int seed; // 0 keeps the values in the order given
+};
+
+// A small xorshift generator so that each thread has its own reproducible
+// stream of random numbers without sharing the state behind rand().
+unsigned int next_random(unsigned int * state){
+    unsigned int x = *state;
+    x ^= x << 13;
+    x ^= x >> 17;
+    x ^= x << 5;
+    *state = x;
+    return x;
+}
+
+// Copy the domains, shuffling the order of the values in each of them.
+struct domain * shuffled_domains(struct domain * D, int n, unsigned int seed){
+    struct domain * copy = (struct domain *) malloc(n * sizeof(struct domain));
+    unsigned int state = seed ? seed : 1;
+    int var, i, j, temp;
+    for (var = 0; var < n; var++){
+        struct domain d = *(D + var);
+        (copy + var)->size = d.size;
+        (copy + var)->values = (int *) malloc((d.size + 1) * sizeof(int));
+        memcpy((copy + var)->values, d.values, d.size * sizeof(int));
+        for (i = d.size - 1; i > 0; i--){
+            j = next_random(&state) % (i + 1);
+            temp = *((copy + var)->values + i);
+            *((copy + var)->values + i) = *((copy + var)->values + j);
+            *((copy + var)->values + j) = temp;
+        }
+    }
+    return copy;
+}
+
+void free_domains(struct domain * D, int n){
+    int var;
+    for (var = 0; var < n; var++){
+        free((D + var)->values);
+    }
+    free(D);
+}
+
+// The search flags used by the given thread. The first thread runs exactly
+// what was asked for, so the portfolio never does worse than a single
+// search, and every other thread flips the variable ordering.
+int portfolio_flags(int flags, int thread){
+    if (thread % 2)
+        return flags ^ MRV_ORDERING;
+    return flags;
+}
+
+void * portfolio_worker(void * arg){
+    struct portfolio_job * job = (struct portfolio_job *) arg;
+    struct problem * p = job->p;
+
+    // Restarts do their own shuffling
+    if (job->flags & RANDOM_RESTARTS){
+        restart_search(p, job->best, job->flags, job->seed ? job->seed : 1);
+        return NULL;
+    }
+
+    struct assignment * a = initialize_assignment(p->total, p->leaders, p->times, p->genders, p->bin_constraints, p->weights, p->rank, p->hint);
+    struct domain * D = p->D;
+    if (job->seed)
+        D = shuffled_domains(p->D, p->total, job->seed);
+
+    backtracking_search(a, D, job->best, job->flags, 0);
+
+    if (job->seed)
+        free_domains(D, p->total);
+    free_assignment(a);
+    return NULL;
+}
+
+// The shuffle seed of the given thread. The first thread keeps the values in
+// the order given and the others each get their own stream from seed.
+unsigned int thread_seed(unsigned int seed, int thread){
+    unsigned int state = (seed ^ 2654435761u * (unsigned int) thread) | 1;
+    if (!thread)
+        return 0;
+    return next_random(&state);
+}
+
+// Run threads searches at once and leave the best assignment any of them
+// found in best.
+void portfolio_search(struct problem * p, struct incumbent * best, int flags, int threads, unsigned int seed){
+    if (threads < 1)
+        threads = 1;
+    pthread_t handles[threads];
+    struct portfolio_job jobs[threads];
+    int started[threads];
+    int i, running = 0;
+    for (i = 0; i < threads; i++){
+        (jobs + i)->p = p;
+        (jobs + i)->best = best;
+        (jobs + i)->flags = portfolio_flags(flags, i);
+        (jobs + i)->seed = thread_seed(seed, i);
+        *(started + i) = !pthread_create(handles + i, NULL, portfolio_worker, jobs + i);
+        running += *(started + i);
+    }
+
+    // If no thread could be started do the work here instead
+    if (!running)
+        portfolio_worker(jobs);
+
+    for (i = 0; i < threads; i++){
+        if (*(started + i))
+            pthread_join(*(handles + i), NULL);
+    }
+}
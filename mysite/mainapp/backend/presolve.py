@@ -0,0 +1,158 @@
+# Presolve for the section assignment problem. Before a solver is called the
+# domains are cut down to the values that could be part of an assignment, as
+# far as a few cheap rules can tell, so the search starts from smaller
+# domains and a course that clearly has no assignment is reported straight
+# away with the reasons instead of after the whole time budget.
+#
+# The rules are applied over and over until none of them changes anything:
+#
+#  - A student cannot be in a section if they cannot be with any of the
+#    leaders who could take it.
+#  - A leader cannot take a section if none of the students who could be in
+#    it can be with them, since every section with a leader needs a student.
+#  - A leader with a single section left has it to themselves.
+#  - A student with a single section left needs a leader there that they can
+#    be with, so the leaders they cannot be with cannot take it, and if only
+#    one leader is left who can take it then that leader must.
+#
+# The domains keep their order, so the preference ranks only count the
+# sections each person could actually be given, as they already do for the
+# sections no leader is available for (see generate_availability_problem).
+
+from array import array
+
+class Infeasible(Exception):
+    # Raised with the list of reasons a course has no assignment
+    def __init__(self, reasons):
+        Exception.__init__(self, reasons)
+        self.reasons = reasons
+
+    def __str__(self):
+        return '; '.join(self.reasons)
+
+def names(items):
+    items = list(items)
+    if len(items) == 1:
+        return items[0]
+    return ', '.join(items[:-1]) + ' and ' + items[-1]
+
+def augment(leader, domains, holder, seen):
+    # Find a section for leader by an augmenting path, marking the sections
+    # looked at in seen
+    for t in domains[leader]:
+        if t in seen:
+            continue
+        seen.add(t)
+        if holder[t] < 0 or augment(holder[t], domains, holder, seen):
+            holder[t] = leader
+            return True
+    return False
+
+def reduce_domains(domains, cant, leader_count, times):
+    # Apply each rule once to domains, a list of lists of sections, and
+    # return whether anything was removed
+    n = len(domains)
+    leader_sections = [set(domains[l]) for l in range(leader_count)]
+    changed = False
+
+    # Students lose the sections whose possible leaders they all cannot be with
+    leader_total = [0] * times
+    for l in range(leader_count):
+        for t in domains[l]:
+            leader_total[t] += 1
+    for s in range(leader_count, n):
+        kept = [t for t in domains[s]
+                if leader_total[t] > sum(1 for l in cant[s] if t in leader_sections[l])]
+        if len(kept) < len(domains[s]):
+            domains[s] = kept
+            changed = True
+
+    # Leaders lose the sections whose possible students all cannot be with them
+    student_total = [0] * times
+    blocked = [{} for t in range(times)]
+    for s in range(leader_count, n):
+        for t in domains[s]:
+            student_total[t] += 1
+            for l in cant[s]:
+                blocked[t][l] = blocked[t].get(l, 0) + 1
+    for l in range(leader_count):
+        kept = [t for t in domains[l] if student_total[t] > blocked[t].get(l, 0)]
+        if len(kept) < len(domains[l]):
+            domains[l] = kept
+            changed = True
+
+    # Leaders with one section left keep the others out of it
+    taken = [-1] * times
+    for l in range(leader_count):
+        if len(domains[l]) == 1:
+            t = domains[l][0]
+            if taken[t] >= 0:
+                return changed, (taken[t], l, t)
+            taken[t] = l
+    for l in range(leader_count):
+        if len(domains[l]) > 1 and [t for t in domains[l] if taken[t] >= 0]:
+            domains[l] = [t for t in domains[l] if taken[t] < 0]
+            changed = True
+
+    # Students with one section left need a leader there they can be with
+    for s in range(leader_count, n):
+        if len(domains[s]) != 1:
+            continue
+        t = domains[s][0]
+        for l in cant[s]:
+            if t in domains[l]:
+                domains[l] = [u for u in domains[l] if u != t]
+                changed = True
+        able = [l for l in range(leader_count) if t in domains[l]]
+        if len(able) == 1 and len(domains[able[0]]) > 1:
+            domains[able[0]] = [t]
+            changed = True
+    return changed, None
+
+def presolve(X, ints_to_domains, leader_count, domain_offsets, domain_values, constraint_offsets, constraint_values):
+    '''
+    Cut down the domains of the problem made by generate_availability_problem
+    and return them as new offset and value arrays. Raises Infeasible with
+    the reasons if the course cannot have an assignment.
+    '''
+    n = len(X)
+    times = len(ints_to_domains)
+    student_count = n - leader_count
+    if student_count < leader_count:
+        raise Infeasible(['%d students are too few for %d leaders, every section needs a student'
+                          % (student_count, leader_count)])
+
+    domains = [list(domain_values[domain_offsets[i]:domain_offsets[i + 1]]) for i in range(n)]
+    cant = [set(constraint_values[constraint_offsets[i]:constraint_offsets[i + 1]]) if i >= leader_count else set()
+            for i in range(n)]
+
+    changed = True
+    while changed:
+        changed, clash = reduce_domains(domains, cant, leader_count, times)
+        if clash is not None:
+            first, second, t = clash
+            raise Infeasible(['%s and %s can only lead %s' % (X[first], X[second], ints_to_domains[t])])
+        empty = [i for i in range(n) if not domains[i]]
+        if empty:
+            reasons = []
+            for i in empty:
+                role = 'lead' if i < leader_count else 'attend'
+                reasons.append('%s has no section they can %s' % (X[i], role))
+            raise Infeasible(reasons)
+
+    # The leaders need different sections. If some cannot all have one, the
+    # leaders reached by the failed search compete for fewer sections.
+    holder = [-1] * times
+    for l in range(leader_count):
+        seen = set()
+        if not augment(l, domains, holder, seen):
+            rivals = sorted(set([l] + [holder[t] for t in seen]))
+            raise Infeasible(['%s can only lead %s between them'
+                              % (names(X[r] for r in rivals), names(sorted(ints_to_domains[t] for t in seen)))])
+
+    offsets = array('i', [0])
+    values = array('i')
+    for d in domains:
+        values.extend(d)
+        offsets.append(len(values))
+    return offsets, values
@@ -0,0 +1,331 @@
+#include "assign_students.h"
+
+// Forward checking for the backtracking search. Every variable keeps a table
+// of the sections that are still live in its domain. Assigning a variable
+// removes the values that became inconsistent from the domains of the other
+// variables and every removal is pushed onto a trail so that it can be undone
+// when the search backtracks.
+//
+// Besides the cant_be_with constraints and the one leader per section
+// constraint, the number of leaders and students that could still end up in
+// each section is tracked. A section that no leader can take is removed from
+// every student's domain, and a section that no student can attend is removed
+// from every leader's domain since it would be left empty.
+//
+// When there are at most BITSET_TIMES section times each domain is a single
+// machine word with one bit per section, so membership tests, removals and
+// intersections are single instructions and the size of a domain is its
+// population count. Courses with more times use a table of live flags and
+// keep the domain sizes in an array instead.
+
+struct domain_state * initialize_domain_state(struct assignment * a, struct domain * D){
+    struct domain_state * s = (struct domain_state *) malloc(sizeof(struct domain_state));
+    int total = a->total;
+    int leaders = a->leaders;
+    int times = a->times;
+    s->total = total;
+    s->leaders = leaders;
+    s->times = times;
+
+    s->masks = NULL;
+    s->live = NULL;
+    s->size = NULL;
+    if (times <= BITSET_TIMES)
+        s->masks = (uint64_t *) calloc(total, sizeof(uint64_t));
+    else{
+        s->live = (char *) calloc(total * times, sizeof(char));
+        s->size = (int *) calloc(total, sizeof(int));
+    }
+    s->leader_support = (int *) calloc(times, sizeof(int));
+    s->student_support = (int *) calloc(times, sizeof(int));
+
+    int var, i, value;
+    for (var = 0; var < total; var++){
+        struct domain d = *(D + var);
+        for (i = 0; i < d.size; i++){
+            value = *(d.values + i);
+            if (value < 0 || value >= times || is_live(s, var, value))
+                continue;
+            if (s->masks)
+                *(s->masks + var) |= ((uint64_t) 1) << value;
+            else{
+                *(s->live + var * times + value) = 1;
+                *(s->size + var) += 1;
+            }
+        }
+
+        // Leave out the sections the student can never be in
+        if (a->forbidden_sections){
+            uint64_t * forbidden = a->forbidden_sections + var * a->section_words;
+            if (s->masks)
+                *(s->masks + var) &= ~*forbidden;
+            else{
+                for (value = 0; value < times; value++){
+                    if (is_live(s, var, value) && test_bit(forbidden, value)){
+                        *(s->live + var * times + value) = 0;
+                        *(s->size + var) -= 1;
+                    }
+                }
+            }
+        }
+
+        for (value = 0; value < times; value++){
+            if (!is_live(s, var, value))
+                continue;
+            if (var < leaders)
+                *(s->leader_support + value) += 1;
+            else
+                *(s->student_support + value) += 1;
+        }
+    }
+
+    // A value is never removed twice without being restored in between
+    // so the trail can hold at most one entry for every live value.
+    s->trail = (int *) malloc(2 * total * times * sizeof(int));
+    s->trail_size = 0;
+
+    // Each section can run out of leaders and run out of students once.
+    s->pending = (int *) malloc(2 * times * sizeof(int));
+    s->pending_size = 0;
+
+    // Invert the cant_be_with lists so that each leader knows the
+    // students that cannot be placed in its section.
+    s->excluded_start = (int *) calloc(leaders + 1, sizeof(int));
+    int r;
+    for (var = leaders; var < total; var++){
+        struct domain restrictions = *(a->bin_constraints + var);
+        for (i = 0; i < restrictions.size; i++){
+            r = *(restrictions.values + i);
+            if (0 <= r && r < leaders)
+                *(s->excluded_start + r + 1) += 1;
+        }
+    }
+    for (i = 0; i < leaders; i++){
+        *(s->excluded_start + i + 1) += *(s->excluded_start + i);
+    }
+    s->excluded = (int *) malloc((*(s->excluded_start + leaders) + 1) * sizeof(int));
+    int next[leaders + 1];
+    memcpy(next, s->excluded_start, (leaders + 1) * sizeof(int));
+    for (var = leaders; var < total; var++){
+        struct domain restrictions = *(a->bin_constraints + var);
+        for (i = 0; i < restrictions.size; i++){
+            r = *(restrictions.values + i);
+            if (0 <= r && r < leaders){
+                *(s->excluded + *(next + r)) = var;
+                *(next + r) += 1;
+            }
+        }
+    }
+
+    s->leader_before = a->leader_before;
+    s->leader_after = a->leader_after;
+
+    s->depth = -1;
+    s->indirect = 0;
+    s->wiped = -1;
+    s->removed_at = (int *) malloc((total * times + 1) * sizeof(int));
+    s->removed_indirectly = (char *) malloc(total * times + 1);
+
+    return s;
+}
+
+void free_domain_state(struct domain_state * s){
+    free(s->masks);
+    free(s->live);
+    free(s->size);
+    free(s->leader_support);
+    free(s->student_support);
+    free(s->trail);
+    free(s->pending);
+    free(s->excluded_start);
+    free(s->excluded);
+    free(s->removed_at);
+    free(s->removed_indirectly);
+    free(s);
+}
+
+int is_live(struct domain_state * s, int var, int value){
+    if (s->masks)
+        return (*(s->masks + var) >> value) & 1;
+    return *(s->live + var * s->times + value);
+}
+
+// The number of values left in the domain of var
+int domain_size(struct domain_state * s, int var){
+    if (s->masks)
+        return __builtin_popcountll(*(s->masks + var));
+    return *(s->size + var);
+}
+
+// Remove a value from the domain of var and record it on the trail. Returns 0
+// if this wiped out the domain of var and 1 otherwise.
+int remove_value(struct domain_state * s, int var, int value){
+    if (!is_live(s, var, value))
+        return 1;
+
+    if (s->masks)
+        *(s->masks + var) &= ~(((uint64_t) 1) << value);
+    else{
+        *(s->live + var * s->times + value) = 0;
+        *(s->size + var) -= 1;
+    }
+    *(s->trail + s->trail_size) = var;
+    *(s->trail + s->trail_size + 1) = value;
+    s->trail_size += 2;
+    *(s->removed_at + var * s->times + value) = s->depth;
+    *(s->removed_indirectly + var * s->times + value) = s->indirect;
+
+    // Queue up sections that have run out of leaders or students. Leader
+    // shortages are queued as the section itself and student shortages
+    // are offset by the number of times.
+    if (var < s->leaders){
+        *(s->leader_support + value) -= 1;
+        if (!*(s->leader_support + value)){
+            *(s->pending + s->pending_size) = value;
+            s->pending_size += 1;
+        }
+    }
+    else{
+        *(s->student_support + value) -= 1;
+        if (!*(s->student_support + value)){
+            *(s->pending + s->pending_size) = s->times + value;
+            s->pending_size += 1;
+        }
+    }
+
+    if (!domain_size(s, var)){
+        s->wiped = var;
+        return 0;
+    }
+    return 1;
+}
+
+// Put back every value removed since the trail had the given size.
+void undo_trail(struct domain_state * s, int mark){
+    int var, value;
+    while (s->trail_size > mark){
+        s->trail_size -= 2;
+        var = *(s->trail + s->trail_size);
+        value = *(s->trail + s->trail_size + 1);
+        if (s->masks)
+            *(s->masks + var) |= ((uint64_t) 1) << value;
+        else{
+            *(s->live + var * s->times + value) = 1;
+            *(s->size + var) += 1;
+        }
+        if (var < s->leaders)
+            *(s->leader_support + value) += 1;
+        else
+            *(s->student_support + value) += 1;
+    }
+}
+
+// Work through the queue of sections that have run out of leaders or of
+// students. Returns 0 if some domain was wiped out.
+int propagate_pending(struct domain_state * s){
+    int pos, code, section, var;
+    int ok = 1;
+    s->indirect = 1;
+    for (pos = 0; ok && pos < s->pending_size; pos++){
+        code = *(s->pending + pos);
+
+        // Without a leader no student can be in the section
+        if (code < s->times){
+            section = code;
+            for (var = s->leaders; ok && var < s->total; var++){
+                ok = remove_value(s, var, section);
+            }
+        }
+        // Without students no leader can take the section
+        else{
+            section = code - s->times;
+            for (var = 0; ok && var < s->leaders; var++){
+                ok = remove_value(s, var, section);
+            }
+        }
+    }
+    s->pending_size = 0;
+    s->indirect = 0;
+    return ok;
+}
+
+// Prune the domains before any variable has been assigned. Returns 0 if
+// the problem has no solution.
+int propagate_initial(struct domain_state * s){
+    int var, section;
+    s->depth = -1;
+    for (var = 0; var < s->total; var++){
+        if (!domain_size(s, var))
+            return 0;
+    }
+    s->pending_size = 0;
+    for (section = 0; section < s->times; section++){
+        if (!*(s->leader_support + section)){
+            *(s->pending + s->pending_size) = section;
+            s->pending_size += 1;
+        }
+        if (!*(s->student_support + section)){
+            *(s->pending + s->pending_size) = s->times + section;
+            s->pending_size += 1;
+        }
+    }
+    return propagate_pending(s);
+}
+
+// Propagate the assignment of value to var. Returns 0 if this emptied the
+// domain of some variable, in which case the caller should undo the trail.
+int propagate(struct domain_state * s, int var, int value){
+    int section, other, i;
+    int ok = 1;
+    s->pending_size = 0;
+
+    // The variable itself keeps only the assigned value
+    if (s->masks){
+        uint64_t rest = *(s->masks + var) & ~(((uint64_t) 1) << value);
+        while (ok && rest){
+            section = __builtin_ctzll(rest);
+            rest &= rest - 1;
+            ok = remove_value(s, var, section);
+        }
+    }
+    else{
+        for (section = 0; ok && section < s->times; section++){
+            if (section != value)
+                ok = remove_value(s, var, section);
+        }
+    }
+
+    if (var < s->leaders){
+        // No other leader can take the same section
+        for (other = 0; ok && other < s->leaders; other++){
+            if (other != var)
+                ok = remove_value(s, other, value);
+        }
+
+        // and neither can the students that cannot be with this leader
+        for (i = *(s->excluded_start + var); ok && i < *(s->excluded_start + var + 1); i++){
+            ok = remove_value(s, *(s->excluded + i), value);
+        }
+
+        // Interchangeable leaders before this one need earlier sections
+        // and those after it need later ones (see symmetry.c)
+        if (s->leader_before){
+            for (other = *(s->leader_before + var); ok && other >= 0; other = *(s->leader_before + other)){
+                for (section = value; ok && section < s->times; section++){
+                    ok = remove_value(s, other, section);
+                }
+            }
+            for (other = *(s->leader_after + var); ok && other >= 0; other = *(s->leader_after + other)){
+                for (section = 0; ok && section <= value; section++){
+                    ok = remove_value(s, other, section);
+                }
+            }
+        }
+    }
+
+    if (!ok){
+        s->pending_size = 0;
+        return 0;
+    }
+    return propagate_pending(s);
+}
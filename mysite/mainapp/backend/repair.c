@@ -0,0 +1,134 @@
+#include "assign_students.h"
+
+// Repairing an earlier assignment after the problem has changed, usually
+// because one student has changed their availability. Rather than solving
+// the whole course again the variables whose old section is still allowed
+// keep it and only the rest are searched over, which takes milliseconds
+// when little has changed.
+//
+// The repair is tried in two stages, each with a share of the time left:
+//
+//  1. Every variable whose old section is still allowed keeps it and the
+//     others are found by backtracking_search with the kept ones fixed.
+//  2. Only the leaders keep their sections and the students are all placed
+//     again with a min cost flow (see flow.c).
+//
+// Each stage stops at the first assignment it finds, which is then improved
+// by local search. If neither works the caller falls back to solving from
+// scratch.
+//
+// A hint is a softer way to start from an earlier assignment: nothing is
+// fixed, but every variable tries its hinted section first and a hint that
+// is already a valid assignment becomes the incumbent, so the search only
+// looks for something better than it.
+
+// Whether value is in the domain d
+int in_domain(struct domain d, int value){
+    int i;
+    for (i = 0; i < d.size; i++){
+        if (*(d.values + i) == value)
+            return 1;
+    }
+    return 0;
+}
+
+// Give the variables of the empty assignment a the sections they had in
+// previous where that is still allowed. A leader keeps its section if it is
+// still in its domain and no other leader has kept it. With keep_students a
+// student keeps its section if it is still in its domain, its leader kept it
+// and the student can be with that leader. Returns the number of variables
+// that kept their section.
+int keep_previous(struct assignment * a, struct domain * D, int * previous, int keep_students){
+    int var, section;
+    int kept = 0;
+    for (var = 0; var < a->leaders; var++){
+        section = *(previous + var);
+        if (0 <= section && section < a->times && !*(a->has_leader + section) && in_domain(*(D + var), section)){
+            set_section(a, var, section);
+            kept++;
+        }
+    }
+    if (!keep_students)
+        return kept;
+    for (var = a->leaders; var < a->total; var++){
+        section = *(previous + var);
+        if (0 <= section && section < a->times && *(a->has_leader + section) &&
+            in_domain(*(D + var), section) && check_bin_constraints(a, var, section)){
+            set_section(a, var, section);
+            kept++;
+        }
+    }
+    return kept;
+}
+
+// Repair the assignment previous for the problem p, leaving the result in
+// best. Returns 1 if the repair found an assignment and 0 if the problem has
+// to be solved from scratch. An incumbent that was there before, such as a
+// valid hint, does not count: the repair has to improve on it. Symmetry
+// breaking, restarts and the student flow all assume that nothing is assigned
+// to begin with so they are left out, and LOCAL_SEARCH is added to stop at the
+// first assignment found.
+int repair_search(struct problem * p, struct incumbent * best, int * previous, int flags){
+    long long deadline = best->deadline;
+    long long now;
+    int stage, found = 0;
+    double before;
+    int repair_flags = (flags & (MRV_ORDERING | FORWARD_CHECKING | BRANCH_AND_BOUND | BACKJUMPING | NOGOOD_LEARNING)) | LOCAL_SEARCH;
+    for (stage = 1; stage <= 2 && !found; stage++){
+        now = monotonic_milliseconds();
+        best->deadline = now + (deadline - now) / REPAIR_SHARE;
+        __atomic_store_n(&best->done, 0, __ATOMIC_RELAXED);
+        before = incumbent_cost(best);
+
+        struct assignment * a = initialize_assignment(p->total, p->leaders, p->times, p->genders, p->bin_constraints, p->weights, p->rank, p->hint);
+        keep_previous(a, p->D, previous, stage == 1);
+        if (stage == 2 && a->leaders_assigned == a->leaders){
+            find_forbidden_sections(a, p->D);
+            if (flow_students(a, p->D, NULL))
+                offer_solution(best, a, cost(a));
+        }
+        else
+            backtracking_search(a, p->D, best, repair_flags, 0);
+        free_assignment(a);
+        found = incumbent_cost(best) < before;
+    }
+    best->deadline = deadline;
+    __atomic_store_n(&best->done, 0, __ATOMIC_RELAXED);
+    return found;
+}
+
+// A copy of the domains D with the section of each variable in hint moved to
+// the front, when it is in the domain, so the search tries it first. Free it
+// with free_domains.
+struct domain * hinted_domains(struct domain * D, int n, int * hint){
+    struct domain * copy = (struct domain *) malloc(n * sizeof(struct domain));
+    int var, i, value;
+    for (var = 0; var < n; var++){
+        struct domain d = *(D + var);
+        (copy + var)->size = d.size;
+        (copy + var)->values = (int *) malloc((d.size + 1) * sizeof(int));
+        memcpy((copy + var)->values, d.values, d.size * sizeof(int));
+        value = *(hint + var);
+        for (i = 0; i < d.size; i++){
+            if (*(d.values + i) == value){
+                // Shift the values before it back by one
+                memmove((copy + var)->values + 1, (copy + var)->values, i * sizeof(int));
+                *((copy + var)->values) = value;
+                break;
+            }
+        }
+    }
+    return copy;
+}
+
+// Offer hint to the incumbent if it is a complete assignment that meets every
+// constraint of the problem p. Returns 1 if the incumbent was replaced.
+int offer_hint(struct problem * p, struct incumbent * best, int * hint){
+    struct assignment * a = initialize_assignment(p->total, p->leaders, p->times, p->genders, p->bin_constraints, p->weights, p->rank, p->hint);
+    int offered = 0;
+    if (keep_previous(a, p->D, hint, 1) == p->total && !a->section_has_more_than_one_leader &&
+        !a->too_few_students_in_a_section && !a->student_in_section_with_no_leader)
+        offered = offer_solution(best, a, cost(a));
+    free_assignment(a);
+    return offered;
+}
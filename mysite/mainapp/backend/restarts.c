@@ -0,0 +1,55 @@
+#include "assign_students.h"
+
+// Randomized restarts. How long a backtracking search takes can depend
+// wildly on the order the values are tried in: an early bad choice can leave
+// the search stuck in a subtree with nothing good in it. With RANDOM_RESTARTS
+// the search is cut off after a number of nodes and started over with the
+// values of every domain shuffled differently, keeping the incumbent so that
+// each run prunes with the best solution found so far.
+//
+// The node limits follow the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ... times
+// RESTART_NODES, which is within a logarithmic factor of the best fixed limit
+// without having to know it. The limits keep growing so eventually a run is
+// long enough to finish its tree, which proves the incumbent optimal. Every
+// shuffle comes from the seed so the same seed gives the same runs.
+
+// The i-th term of the Luby sequence, counting from 1
+long luby(long i){
+    long size = 1;
+    int power = 0;
+
+    // Find the smallest 2^k - 1 that reaches i
+    while (size < i){
+        size = 2 * size + 1;
+        power++;
+    }
+
+    // The sequence up to 2^k - 1 is two copies of the sequence up to
+    // 2^(k-1) - 1 followed by 2^(k-1)
+    while (size != i){
+        size = (size - 1) / 2;
+        power--;
+        if (i > size)
+            i -= size;
+    }
+    return ((long) 1) << power;
+}
+
+// Search with restarts until the tree of some run is finished or time runs
+// out. The first run keeps the values in the order given.
+void restart_search(struct problem * p, struct incumbent * best, int flags, unsigned int seed){
+    unsigned int state = seed ? seed : 1;
+    long run;
+    for (run = 1; !__atomic_load_n(&best->done, __ATOMIC_RELAXED) && !out_of_time(best); run++){
+        struct assignment * a = initialize_assignment(p->total, p->leaders, p->times, p->genders, p->bin_constraints, p->weights, p->rank, p->hint);
+        struct domain * D = p->D;
+        if (run > 1)
+            D = shuffled_domains(p->D, p->total, next_random(&state));
+
+        backtracking_search(a, D, best, flags, RESTART_NODES * luby(run));
+
+        if (run > 1)
+            free_domains(D, p->total);
+        free_assignment(a);
+    }
+}
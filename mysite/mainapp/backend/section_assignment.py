@@ -1,91 +1,117 @@
-# Function that loads the student availability data from the given csv files and outputs a csp along 
-# with information that 
+from array import array
+
+# Whether a flag from the availability data is set. The model gives booleans
+# (see StudentAvailability.as_dict) but older data used the strings 'true'
+# and 'false'.
+def is_set(value):
+    return value is True or value == 'true'
+
+# Function that encodes the student availability data as a csp along with
+# the tables for turning its integers back into names and sections.
+#
+# Leaders get the first numbers, followed by the students. The domain of
+# each variable lists its section numbers in order of preference and the
+# binary constraints of each student list the leaders it cannot be with,
+# whichever of the two asked for it. Both are given as an array of offsets
+# and an array of values, where the values of variable i run from offsets[i]
+# up to offsets[i + 1] (see domains_from_offsets in assign_students.c).
+# Only the sections some leader can take are numbered, so a course with no
+# leaders has no sections.
+#
+# The data is read once and everything is built in time linear in its size.
 def generate_availability_problem(data):
 
+    # Split the names, keeping the leaders first
     leaders = []
-    leader_domains = []
     students = []
-    student_domains = []
-
-    for name in data:
-        student = data[name]
-        availabilities = student['section_availability_ordered']
-
-        # Check if they are a ta
-        if student['is_ta'] == "true":
-            leaders.append(name)
-            leader_domains.append(set(availabilities))
+    for name, student in data.items():
+        if is_set(student['is_ta']):
+            leaders.append((name, student))
         else:
-            students.append(name)
-            student_domains.append(set(availabilities))
-
+            students.append((name, student))
     leader_count = len(leaders)
-    student_count = len(students)
-    
-    # Make one list containing all of the sections for which leaders are available
-    ints_to_domains = list(reduce(lambda a,b : a | b, leader_domains))
-
-    # Make a dictionary from strings to integers
-    domains_to_ints = {}
-    for i in range(len(ints_to_domains)):
-        domains_to_ints[ints_to_domains[i]] = i
 
-    # and initalize the gender table as an empty list
-    gender_table = [0]*(student_count + leader_count)
-
-    # Assign numbers to the leaders and students
-    # Leaders get the first numbers
-    X = ['']*(leader_count + student_count)
+    X = []
     name_to_int = {}
-    for i in range(leader_count):
-        X[i] = leaders[i]
-        name_to_int[leaders[i]] = i
-        gender_table[i] = 0 if data[leaders[i]]['is_male'] == 'true' else 1 
-    for i in range(student_count):
-        X[i + leader_count] = students[i] 
-        name_to_int[students[i]] = i + leader_count
-        gender_table[i + leader_count] = 0 if data[students[i]]['is_male'] == 'true' else 1 
-
-    # Initialize and empty list of binary constraints
-    bin_constraints = [set() for i in len(X)]
-    for name in data:
-        for r in data[name]['cant_be_with']:
-            if r in data:
-                bin_constraints[name_to_int[r]].add(name_to_int[name])
-
-    # Initialize the domain as empty sets
-    D = [set() for i in range(leader_count + student_count)]
-
-    # Make the domains for the leaders
-    for i in range(leader_count):
-        for x in leader_domains[i]:
-            if x in domains_to_ints:
-                D[i].add(domains_to_ints[x])
-
-    # Make the domains for the students
-    for i in range(student_count):
-        for x in student_domains[i]:
-            if x in domains_to_ints:
-                D[i + leader_count].add(domains_to_ints[x])
-
-    # Return the csp and the table for getting domain strings from integers
-    return D, X, ints_to_domains, leader_count, gender_table, bin_constraints
-
-# Pretty print the result of a 
-def pretty_print_sections(D, X, assignment, ints_to_domains, section_leaders):
+    ints_to_domains = []
+    domains_to_ints = {}
+    genders = array('i')
+    domain_offsets = array('i', [0])
+    domain_values = array('i')
+
+    # (student, leader) pairs that cannot be together
+    conflicts = []
+
+    for i, (name, student) in enumerate(leaders + students):
+        X.append(name)
+        name_to_int[name] = i
+        genders.append(0 if is_set(student['is_male']) else 1)
+
+        # Leaders add their sections to the table, students only get the
+        # sections some leader can take
+        seen = set()
+        for section in student['section_availability_ordered']:
+            if i < leader_count and section not in domains_to_ints:
+                domains_to_ints[section] = len(ints_to_domains)
+                ints_to_domains.append(section)
+            if section in domains_to_ints and section not in seen:
+                seen.add(section)
+                domain_values.append(domains_to_ints[section])
+        domain_offsets.append(len(domain_values))
+
+        # Every leader has a number by the time the students are reached
+        if i >= leader_count:
+            for other in student['cant_be_with']:
+                if name_to_int.get(other, leader_count) < leader_count:
+                    conflicts.append((i, name_to_int[other]))
+
+    # A leader can also ask not to be with a student, which has to wait
+    # until the student has a number
+    for name, leader in leaders:
+        for other in leader['cant_be_with']:
+            if name_to_int.get(other, -1) >= leader_count:
+                conflicts.append((name_to_int[other], name_to_int[name]))
+
+    # Lay out the conflicts by student with a counting sort
+    constraint_offsets = array('i', [0]) * (len(X) + 1)
+    for student, leader in conflicts:
+        constraint_offsets[student + 1] += 1
+    for i in range(len(X)):
+        constraint_offsets[i + 1] += constraint_offsets[i]
+    constraint_values = array('i', [0]) * len(conflicts)
+    position = constraint_offsets[:-1]
+    for student, leader in conflicts:
+        constraint_values[position[student]] = leader
+        position[student] += 1
+
+    # Return the csp and the tables for getting names and section strings from integers
+    return (X, ints_to_domains, leader_count, genders,
+            domain_offsets, domain_values, constraint_offsets, constraint_values)
+
+# Pretty print an assignment of the problem made by
+# generate_availability_problem, given as the section number of each
+# variable with -1 for anyone without a section
+def pretty_print_sections(X, assignment, ints_to_domains, leader_count):
 
     # Initialize the section strings:
     section_strings = {}
-    for i in range(section_leaders):
+    for i in range(leader_count):
         section = assignment[i]
-        section_strings[section] =  ['Time: ', ints_to_domains[section], 
-                                     '\nLeader: ', X[i],
-                                     '\nStudents:\n']
+        if section >= 0:
+            section_strings[section] =  ['Time: ', ints_to_domains[section],
+                                         '\nLeader: ', X[i],
+                                         '\nStudents:\n']
 
     # Add the students to their assigned sections
-    for i in range(section_leaders, len(assignment)):
-        section_strings[assignment[i]].append('\t' + X[i] + '\n')
+    unassigned = [X[i] for i in range(leader_count) if assignment[i] < 0]
+    for i in range(leader_count, len(assignment)):
+        if assignment[i] in section_strings:
+            section_strings[assignment[i]].append('\t' + X[i] + '\n')
+        else:
+            unassigned.append(X[i])
 
     # Print the section strings
     for i in section_strings:
         print ''.join(section_strings[i])
+    if unassigned:
+        print 'No section:\n' + ''.join('\t' + name + '\n' for name in unassigned)
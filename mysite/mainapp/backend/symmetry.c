@@ -0,0 +1,143 @@
+#include "assign_students.h"
+
+// Symmetry breaking for the backtracking search. Two leaders with the same
+// domain and gender that the same students cannot be with are interchangeable:
+// swapping their sections in any assignment gives another assignment with the
+// same cost. Likewise two sections that are in exactly the same domains are
+// interchangeable, since the cost only depends on the sizes and genders of the
+// sections and not on which times they are at. When preferences count (see
+// preference_ranks) leaders must also rank every section the same, and so
+// must every variable with both of two sections in its domain.
+//
+// Without help the search looks at every permutation of interchangeable
+// leaders and sections. With SYMMETRY_BREAKING only one assignment of each
+// permutation class is allowed:
+//
+//  - interchangeable leaders must be in increasing order of section, and
+//  - of two interchangeable sections the later one can only have a leader if
+//    the earlier one does.
+//
+// Both can hold at once. Relabelling interchangeable sections so that the ones
+// with leaders come first does not change which sections the interchangeable
+// leaders could take, and sorting those leaders does not change which sections
+// have leaders, so no cost is lost.
+
+// Fill in leader_before, leader_after and section_before for the domains D.
+// Each links an interchangeable leader or section to the nearest one before or
+// after it, or to -1 if there is none.
+void find_symmetries(struct assignment * a, struct domain * D){
+    int total = a->total;
+    int leaders = a->leaders;
+    int times = a->times;
+    int section_words = a->section_words;
+    int var_words = (total + 63) / 64;
+    int var, i, j, section, w, same;
+
+    // The sections in each variable's domain and the variables whose
+    // domain contains each section
+    uint64_t * domain_bits = (uint64_t *) calloc(total * section_words + 1, sizeof(uint64_t));
+    uint64_t * section_vars = (uint64_t *) calloc(times * var_words + 1, sizeof(uint64_t));
+    for (var = 0; var < total; var++){
+        struct domain d = *(D + var);
+        for (i = 0; i < d.size; i++){
+            section = *(d.values + i);
+            if (0 <= section && section < times){
+                set_bit(domain_bits + var * section_words, section);
+                set_bit(section_vars + section * var_words, var);
+            }
+        }
+    }
+
+    // The students that cannot be with each leader
+    uint64_t * excluded = (uint64_t *) calloc(leaders * var_words + 1, sizeof(uint64_t));
+    for (var = leaders; var < total; var++){
+        for (i = 0; i < leaders; i++){
+            if (test_bit(a->cant_be_with + var * a->leader_words, i))
+                set_bit(excluded + i * var_words, var);
+        }
+    }
+
+    free(a->leader_before);
+    free(a->leader_after);
+    a->leader_before = (int *) malloc((leaders + 1) * sizeof(int));
+    a->leader_after = (int *) malloc((leaders + 1) * sizeof(int));
+    for (i = 0; i < leaders; i++){
+        *(a->leader_before + i) = -1;
+        *(a->leader_after + i) = -1;
+    }
+    for (j = 0; j < leaders; j++){
+        for (i = j - 1; i >= 0; i--){
+            if (*(a->leader_after + i) >= 0 || *(a->genders + i) != *(a->genders + j))
+                continue;
+            same = 1;
+            for (w = 0; w < section_words && same; w++){
+                same = *(domain_bits + i * section_words + w) == *(domain_bits + j * section_words + w);
+            }
+            for (w = 0; w < var_words && same; w++){
+                same = *(excluded + i * var_words + w) == *(excluded + j * var_words + w);
+            }
+            for (section = 0; section < times && same && a->rank; section++){
+                same = *(a->rank + i * times + section) == *(a->rank + j * times + section);
+            }
+            if (same){
+                *(a->leader_before + j) = i;
+                *(a->leader_after + i) = j;
+                break;
+            }
+        }
+    }
+
+    free(a->section_before);
+    a->section_before = (int *) malloc((times + 1) * sizeof(int));
+    for (j = 0; j < times; j++){
+        *(a->section_before + j) = -1;
+        for (i = j - 1; i >= 0; i--){
+            same = 1;
+            for (w = 0; w < var_words && same; w++){
+                same = *(section_vars + i * var_words + w) == *(section_vars + j * var_words + w);
+            }
+            for (var = 0; var < total && same && a->rank; var++){
+                same = *(a->rank + var * times + i) == *(a->rank + var * times + j);
+            }
+            if (same){
+                *(a->section_before + j) = i;
+                break;
+            }
+        }
+    }
+
+    free(domain_bits);
+    free(section_vars);
+    free(excluded);
+}
+
+// Whether leader var can take section value given the sections of the
+// interchangeable leaders placed so far
+int leaders_in_order(struct assignment * a, int var, int value){
+    if (!a->leader_before)
+        return 1;
+    int before = *(a->leader_before + var);
+    int after = *(a->leader_after + var);
+    if (before >= 0 && get_section(a, before) >= 0 && get_section(a, before) >= value)
+        return 0;
+    if (after >= 0 && get_section(a, after) >= 0 && get_section(a, after) <= value)
+        return 0;
+    return 1;
+}
+
+// Whether every section with a leader has a leader in each of the
+// interchangeable sections before it, once section value also has one.
+// Only meaningful when the last leader is being placed.
+int sections_in_order(struct assignment * a, int value){
+    if (!a->section_before)
+        return 1;
+    int section, before;
+    for (section = 0; section < a->times; section++){
+        before = *(a->section_before + section);
+        if (before < 0)
+            continue;
+        if ((*(a->has_leader + section) || section == value) && !*(a->has_leader + before) && before != value)
+            return 0;
+    }
+    return 1;
+}
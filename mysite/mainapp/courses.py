@@ -5,8 +5,10 @@
 # raw availabilities (to be fed to a constraint satisfaction solver)
 # this_site.com/raw_availabilities/$course_id
 # they'll be in JSON
-# and a viable assignment can be found at:
+# and a viable assignment can be started with the button at:
 # this_site.com/assignment/$course_id
+# which sends you on to where it shows up once it is ready:
+# this_site.com/assignment/$course_id/status?job=$job_id
 courses = {
     'CS111F': {
         "sections" : [
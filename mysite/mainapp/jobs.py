@@ -0,0 +1,254 @@
+# Solver jobs
+# Solving a course can take as long as its time budget, which is too long to
+# hold on to a web worker for. Instead a solve is submitted as a job to a
+# pool of worker processes and the caller gets back a job id it can poll.
+# Each worker runs one single threaded solve at a time so several courses
+# solve at once, one per core.
+#
+# The state of every job is kept in Django's cache, where the process that
+# submitted it records the outcome once the solve is done, so any server
+# process can answer a poll. With more than one server process the cache has
+# to be one they share (memcached, the database or files, see CACHES in
+# settings.py); the default local memory cache only works with one. Each
+# server process has its own pool of workers, so SOLVER_QUEUE_SIZE bounds the
+# jobs of each process rather than of the whole site.
+#
+# Results are kept in Django's cache under a hash of the availabilities and
+# the solver settings, so asking again before anyone changes their
+# availability is answered straight away without solving. When something has
+# changed the course's last assignment is repaired rather than solving from
+# scratch, which is quick when only a student or two have changed. A repaired
+# assignment depends on the one it was repaired from and can cost more than a
+# full solve would give, so it is the course's answer until its data changes
+# again but it is not cached for anyone else asking with the same data.
+
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+import mysite.settings
+
+from backend import assign_students
+
+# How many worker processes to run, None for one per core
+SOLVER_PROCESSES = getattr(mysite.settings, 'SOLVER_PROCESSES', None)
+
+# How many jobs each server process can have waiting or running at once
+SOLVER_QUEUE_SIZE = getattr(mysite.settings, 'SOLVER_QUEUE_SIZE', 16)
+
+# How many seconds each solve is given
+SOLVER_TIME_BUDGET = getattr(mysite.settings, 'SOLVER_TIME_BUDGET', 30)
+
+# The search flags to solve with, None for the defaults of assign_students
+SOLVER_FLAGS = getattr(mysite.settings, 'SOLVER_FLAGS', None)
+
+# The weights of the cost terms, None for the defaults of assign_students
+SOLVER_WEIGHTS = getattr(mysite.settings, 'SOLVER_WEIGHTS', None)
+
+# How many seconds local search spends improving a repaired assignment
+SOLVER_REPAIR_IMPROVE_TIME = getattr(mysite.settings, 'SOLVER_REPAIR_IMPROVE_TIME', 1)
+
+# How many seconds a result is kept in the cache
+SOLVER_CACHE_SECONDS = getattr(mysite.settings, 'SOLVER_CACHE_SECONDS', 60 * 60 * 24 * 7)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+class QueueFull(Exception):
+    pass
+
+class Job(object):
+    # A job as recorded in the cache
+    def __init__(self, record):
+        self.record = record
+        self.job_id = record['job_id']
+        self.course_id = record['course_id']
+        self.key = record['key']
+
+    def status(self):
+        return self.record['status']
+
+    def result(self):
+        return self.record.get('assignments')
+
+    def as_dict(self):
+        data = {
+            'job_id' : self.job_id,
+            'course_id' : self.course_id,
+            'status' : self.status(),
+            'seconds' : time.time() - self.record['submitted'],
+            }
+        if data['status'] == DONE:
+            data['assignments'] = self.result()
+        elif data['status'] == FAILED:
+            data['error'] = self.record['error']
+            if 'reasons' in self.record:
+                data['reasons'] = self.record['reasons']
+        return data
+
+_pool = None
+# job id -> (AsyncResult, deadline) for the jobs this process has submitted
+# that are not known to be done
+_pending = {}
+_lock = threading.RLock()
+
+def pool():
+    # started on first use so that importing this module is cheap
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(SOLVER_PROCESSES)
+    return _pool
+
+def job_key(job_id):
+    return 'solver_job:' + job_id
+
+def course_key(course_id):
+    return 'solver_course:' + course_id
+
+def save(record, timeout=SOLVER_CACHE_SECONDS):
+    cache.set(job_key(record['job_id']), record, timeout)
+
+def forget_finished():
+    # Free the places of the jobs that are done. The pool only calls back
+    # when a solve returns, so a solve that raised or whose worker died (and
+    # is still not done by its deadline) is recorded as failed here instead.
+    with _lock:
+        now = time.time()
+        for job_id, (result, deadline) in _pending.items():
+            if result.ready() and result.successful():
+                # finish has already recorded it
+                del _pending[job_id]
+            elif result.ready() or now > deadline:
+                del _pending[job_id]
+                if result.ready():
+                    try:
+                        result.get()
+                    except Exception as e:
+                        error = repr(e)
+                else:
+                    error = 'the solve was lost'
+                record = cache.get(job_key(job_id))
+                if record is not None and record['status'] == PENDING:
+                    record['status'] = FAILED
+                    record['error'] = error
+                    save(record)
+
+# Runs in a worker process
+def solve(data, max_time, flags, weights, previous):
+    improve_time = 0
+    if previous is not None:
+        improve_time = SOLVER_REPAIR_IMPROVE_TIME
+    if flags is None:
+        return assign_students.assign_students(data, max_time, threads=1, improve_time=improve_time, previous=previous, weights=weights)
+    return assign_students.assign_students(data, max_time, flags, threads=1, improve_time=improve_time, previous=previous, weights=weights)
+
+# Runs in a worker process. Failures are returned rather than raised since
+# apply_async only calls back with results.
+def run(data, max_time, flags, weights, previous):
+    try:
+        return {'status' : DONE, 'assignments' : solve(data, max_time, flags, weights, previous)}
+    except assign_students.Infeasible as e:
+        # the course has no assignment, say why
+        return {'status' : FAILED, 'error' : 'infeasible', 'reasons' : e.reasons}
+    except Exception as e:
+        return {'status' : FAILED, 'error' : repr(e)}
+
+def cache_key(data, max_time, flags, weights):
+    # the same availabilities and settings always give the same key, whatever
+    # order the students and their cant_be_with lists come in. The time
+    # budget is part of it so a bigger budget always solves again.
+    canonical = {}
+    for name, availability in data.items():
+        availability = dict(availability)
+        availability['cant_be_with'] = sorted(availability['cant_be_with'])
+        canonical[name] = availability
+    text = json.dumps([canonical, max_time, flags, weights], sort_keys=True)
+    return 'assignment:' + hashlib.sha1(text).hexdigest()
+
+def is_complete(assignments):
+    # whether everyone was given a section, which a solve that ran out of
+    # time before finding an assignment does not do
+    return "NO ASSIGNMENT" not in assignments.values()
+
+def submit(course_id, data, max_time=None, weights=None):
+    '''
+    Start solving a course and return the id of its job. A course that is
+    already being solved keeps its job, as does one whose last solve had the
+    same data and an assignment for everyone. Results in the cache are used
+    without solving; a result is only cached if it is not a repair and
+    everyone has a section.
+    Raises QueueFull if too many jobs are waiting. weights overrides
+    SOLVER_WEIGHTS for this course (see assign_students).
+    '''
+    if max_time is None:
+        max_time = SOLVER_TIME_BUDGET
+    if weights is None:
+        weights = SOLVER_WEIGHTS
+    key = cache_key(data, max_time, SOLVER_FLAGS, weights)
+    with _lock:
+        forget_finished()
+        job = course_job(course_id)
+        if job is not None and job.status() == PENDING:
+            return job.job_id
+        if job is not None and job.status() == DONE and job.key == key and is_complete(job.result()):
+            return job.job_id
+
+        record = {
+            'job_id' : uuid.uuid4().hex,
+            'course_id' : course_id,
+            'key' : key,
+            'status' : PENDING,
+            'submitted' : time.time(),
+            }
+        cached = cache.get(key)
+        if cached is not None:
+            record['status'] = DONE
+            record['assignments'] = cached
+            save(record)
+        else:
+            if len(_pending) >= SOLVER_QUEUE_SIZE:
+                raise QueueFull()
+            previous = None
+            if job is not None and job.status() == DONE and is_complete(job.result()):
+                previous = job.result()
+            # the callback runs back in this process once the solve is done
+            def finish(outcome):
+                record.update(outcome)
+                save(record)
+                # only full solves that gave everyone a section are worth
+                # keeping, a failure is tried again
+                if record['status'] == DONE and previous is None and is_complete(record['assignments']):
+                    cache.set(key, record['assignments'], SOLVER_CACHE_SECONDS)
+                with _lock:
+                    _pending.pop(record['job_id'], None)
+            # recorded before the solve starts so that its outcome is never
+            # overwritten. The job is given up on after the longest it could
+            # wait and run for, and the record is forgotten some time after
+            # that in case this process dies before it is done.
+            timeout = (SOLVER_QUEUE_SIZE + 1) * (max_time + SOLVER_REPAIR_IMPROVE_TIME)
+            save(record, 2 * timeout)
+            result = pool().apply_async(run, (data, max_time, SOLVER_FLAGS, weights, previous), callback=finish)
+            _pending[record['job_id']] = (result, record['submitted'] + timeout)
+
+        cache.set(course_key(course_id), record['job_id'], SOLVER_CACHE_SECONDS)
+        return record['job_id']
+
+def get_job(job_id):
+    forget_finished()
+    record = cache.get(job_key(job_id))
+    if record is None:
+        return None
+    return Job(record)
+
+def course_job(course_id):
+    # the latest job for the course, or None
+    job_id = cache.get(course_key(course_id))
+    if job_id is None:
+        return None
+    return get_job(job_id)
@@ -5,7 +5,20 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import itertools
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.client import RequestFactory
+
+from backend import assign_students
+from backend import presolve
+from backend.section_assignment import generate_availability_problem
+import jobs
 
 
 class SimpleTest(TestCase):
@@ -14,3 +27,530 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def random_course(rng, leaders, students, sections, available=None):
+    # A course with random availabilities, genders and restrictions, each
+    # person available for the given number of sections or a random number
+    names = ['section%d' % t for t in range(sections)]
+    def count():
+        return available or rng.randint(1, sections)
+    data = {}
+    for i in range(leaders):
+        data['leader%d' % i] = {
+            'is_ta' : True,
+            'is_male' : rng.random() < 0.5,
+            'section_availability_ordered' : rng.sample(names, count()),
+            'cant_be_with' : [],
+            }
+    for i in range(students):
+        data['student%d' % i] = {
+            'is_ta' : False,
+            'is_male' : rng.random() < 0.5,
+            'section_availability_ordered' : rng.sample(names, count()),
+            'cant_be_with' : ['leader%d' % rng.randrange(leaders)] if rng.random() < 0.3 else [],
+            }
+    return data
+
+class Course(object):
+    # The problem generate_availability_problem makes of data, with the
+    # domains and restrictions as lists
+    def __init__(self, data):
+        (self.X, self.ints_to_domains, self.leaders, self.genders,
+         self.domain_offsets, self.domain_values, self.constraint_offsets,
+         self.constraint_values) = generate_availability_problem(data)
+        n = len(self.X)
+        self.domains = [list(self.domain_values[self.domain_offsets[i]:self.domain_offsets[i + 1]]) for i in range(n)]
+        self.cant = [list(self.constraint_values[self.constraint_offsets[i]:self.constraint_offsets[i + 1]]) for i in range(n)]
+
+    def presolved(self):
+        # The flat domains presolve cuts these down to, raising Infeasible
+        return presolve.presolve(self.X, self.ints_to_domains, self.leaders, self.domain_offsets, self.domain_values,
+                                 self.constraint_offsets, self.constraint_values)
+
+    def presolved_domains(self):
+        offsets, values = self.presolved()
+        return [list(values[offsets[i]:offsets[i + 1]]) for i in range(len(self.X))]
+
+    def sections(self, result):
+        # The section of every variable in a result of assign_students
+        return list(assign_students.assignment_to_array(result, self.X, self.ints_to_domains))
+
+    def is_valid(self, sections):
+        n = len(self.X)
+        if any(sections[i] not in self.domains[i] for i in range(n)):
+            return False
+        led = sections[:self.leaders]
+        if len(set(led)) < self.leaders:
+            return False
+        for s in range(self.leaders, n):
+            if sections[s] not in led or led.index(sections[s]) in self.cant[s]:
+                return False
+        return all(t in sections[self.leaders:] for t in led)
+
+    def valid_assignments(self):
+        # Every valid assignment, by trying them all
+        for sections in itertools.product(*self.domains):
+            if self.is_valid(list(sections)):
+                yield list(sections)
+
+    def cost(self, sections, weights=None, domains=None):
+        # The cost the solvers give sections, with the preference ranks taken
+        # from domains, by default the ones the course was encoded with
+        all_weights = dict(assign_students.DEFAULT_WEIGHTS)
+        if weights is not None:
+            all_weights.update(weights)
+        if domains is None:
+            domains = self.domains
+        students = len(self.X) - self.leaders
+        mean = float(students) / self.leaders
+        size_error = gender_error = preference_error = 0.0
+        for t in sections[:self.leaders]:
+            count = sections[self.leaders:].count(t)
+            females = sum(self.genders[i] for i in range(len(self.X)) if sections[i] == t)
+            diff = abs(count - 2 * females)
+            size_error += (mean - count) ** 2
+            if not (diff <= 1 or females == 0 or females == count):
+                gender_error += diff * diff
+        for i, t in enumerate(sections):
+            preference_error += domains[i].index(t)
+        return (all_weights['size'] * size_error + all_weights['gender'] * gender_error +
+                all_weights['preference'] * preference_error)
+
+def worst_assignments(rng, leaders, students, times, count):
+    # The first count random courses whose assignments do not all cost the
+    # same, each with its most costly assignment and that cost
+    found = 0
+    while found < count:
+        data = random_course(rng, leaders, students, times)
+        course = Course(data)
+        assignments = list(course.valid_assignments())
+        costs = [course.cost(sections) for sections in assignments]
+        if not assignments or max(costs) == min(costs):
+            continue
+        found += 1
+        yield data, course, assignments[costs.index(max(costs))], max(costs)
+
+# The weights the solvers are checked with against brute force
+WEIGHTS = [None, {'preference' : 1.0}, {'size' : 0.5, 'gender' : 0.0, 'preference' : 3.0}]
+
+DEFAULT_FLAGS = (assign_students.MRV_ORDERING | assign_students.FORWARD_CHECKING | assign_students.BRANCH_AND_BOUND |
+                 assign_students.SYMMETRY_BREAKING | assign_students.LEAST_LOADED)
+
+def small_courses(seed, count, weights_list=WEIGHTS):
+    # Small random courses, each with the cost of its best assignment under
+    # each of weights_list found by trying every assignment, None for each
+    # if it has none
+    rng = random.Random(seed)
+    for trial in range(count):
+        leaders = rng.randint(1, 3)
+        data = random_course(rng, leaders, rng.randint(leaders, 5), rng.randint(leaders, 4))
+        course = Course(data)
+        assignments = list(course.valid_assignments())
+        if not assignments:
+            yield data, course, [None] * len(weights_list)
+            continue
+        # preferences are ranked among the sections presolve leaves
+        domains = course.presolved_domains()
+        yield data, course, [min(course.cost(sections, weights, domains) for sections in assignments) for weights in weights_list]
+
+class SolverTest(TestCase):
+    # Both solvers against brute force on small courses
+
+    def assert_optimal(self, flags, seed, weights_list=WEIGHTS, exact=True, **options):
+        # Solve small courses with the C solver and check each result is
+        # valid and, unless the flags only look for a good one, one of the
+        # best assignments, returning the costs
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        options.setdefault('threads', 1)
+        costs = []
+        for data, course, best in small_courses(seed, 60, weights_list):
+            for weights, cost in zip(weights_list, best):
+                try:
+                    result = assign_students.assign_students(data, 5, flags, weights=weights, **options)
+                except assign_students.Infeasible:
+                    self.assertEqual(cost, None)
+                    costs.append(None)
+                    continue
+                sections = course.sections(result)
+                if cost is None:
+                    self.assertTrue(-1 in sections)
+                    costs.append(None)
+                    continue
+                self.assertTrue(course.is_valid(sections))
+                costs.append(course.cost(sections, weights, course.presolved_domains()))
+                if exact:
+                    self.assertAlmostEqual(costs[-1], cost)
+        return costs
+
+    def test_c_solver(self):
+        self.assert_optimal(DEFAULT_FLAGS, 4)
+
+    def test_backjumping(self):
+        self.assert_optimal(assign_students.MRV_ORDERING | assign_students.FORWARD_CHECKING | assign_students.BRANCH_AND_BOUND |
+                            assign_students.BACKJUMPING | assign_students.NOGOOD_LEARNING, 4)
+
+    def test_threads(self):
+        # The portfolio finds an assignment as good as a single thread does
+        self.assertEqual(self.assert_optimal(DEFAULT_FLAGS, 8, threads=4), self.assert_optimal(DEFAULT_FLAGS, 8, threads=1))
+
+    def test_student_flow(self):
+        # Placing the students by min-cost flow is exact when only the
+        # section sizes count
+        self.assert_optimal(DEFAULT_FLAGS | assign_students.STUDENT_FLOW, 9, [{'gender' : 0.0}, {'size' : 1.0, 'gender' : 0.0}])
+
+    def test_local_search(self):
+        # Annealing the first solution only ever moves to valid assignments
+        self.assert_optimal(DEFAULT_FLAGS | assign_students.LOCAL_SEARCH, 10, exact=False, improve_time=0.02)
+
+    def test_restarts_repeat(self):
+        # Restarts with the same seed shuffle the same way, so they end with
+        # the same assignment even where other seeds break ties differently
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        flags = (assign_students.MRV_ORDERING | assign_students.FORWARD_CHECKING | assign_students.BRANCH_AND_BOUND |
+                 assign_students.RANDOM_RESTARTS)
+        rng = random.Random(12)
+        differ = 0
+        for trial in range(10):
+            # big enough that the first run is cut off before it finishes
+            data = random_course(rng, 3, 12, 4)
+            try:
+                results = [assign_students.assign_students(data, 5, flags, threads=1, seed=seed) for seed in (7, 7, 8)]
+            except assign_students.Infeasible:
+                continue
+            self.assertEqual(results[0], results[1])
+            differ += results[0] != results[2]
+        self.assertTrue(differ > 0)
+
+    def test_numpy_solver(self):
+        try:
+            from backend import numpy_solver
+        except ImportError:
+            self.skipTest('NumPy is not installed')
+        for data, course, best in small_courses(5, 60):
+            for weights, cost in zip(WEIGHTS, best):
+                try:
+                    offsets, values = course.presolved()
+                except presolve.Infeasible:
+                    self.assertEqual(cost, None)
+                    continue
+                all_weights = dict(assign_students.DEFAULT_WEIGHTS)
+                all_weights.update(weights or {})
+                sections = numpy_solver.solve(offsets, values, course.leaders, len(course.ints_to_domains), course.genders,
+                                              course.constraint_offsets, course.constraint_values, 5, all_weights)
+                if cost is None:
+                    self.assertTrue(-1 in sections)
+                    continue
+                self.assertTrue(course.is_valid(sections))
+                self.assertAlmostEqual(course.cost(sections, weights, course.presolved_domains()), cost)
+
+class DeadlineTest(TestCase):
+    def test_budget(self):
+        # A course far too big to finish returns soon after its time budget,
+        # even though every leaf of student flow takes a while
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        data = random_course(random.Random(13), 30, 1000, 60, 10)
+        for flags in (DEFAULT_FLAGS, DEFAULT_FLAGS | assign_students.STUDENT_FLOW,
+                      assign_students.FORWARD_CHECKING | assign_students.BRANCH_AND_BOUND | assign_students.STUDENT_FLOW):
+            start = time.time()
+            assign_students.assign_students(data, 0.2, flags, threads=1)
+            self.assertLess(time.time() - start, 0.5)
+
+    def test_on_improve(self):
+        # Every solution reported is better than the last and the last one
+        # is the one returned
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        rng = random.Random(14)
+        reported = 0
+        for trial in range(10):
+            data = random_course(rng, 4, 20, 5)
+            course = Course(data)
+            costs = []
+            try:
+                result = assign_students.assign_students(data, 5, threads=1,
+                                                         on_improve=lambda assignment, cost: costs.append(cost))
+            except assign_students.Infeasible:
+                continue
+            sections = course.sections(result)
+            if -1 in sections:
+                self.assertEqual(costs, [])
+                continue
+            reported += len(costs)
+            self.assertEqual(costs, sorted(set(costs), reverse=True))
+            self.assertAlmostEqual(costs[-1], course.cost(sections, None, course.presolved_domains()))
+        self.assertTrue(reported > 10)
+
+class PresolveTest(TestCase):
+    def test_reduce_domains_keeps_every_assignment(self):
+        rng = random.Random(6)
+        for trial in range(200):
+            leaders = rng.randint(1, 3)
+            course = Course(random_course(rng, leaders, rng.randint(leaders, 5), rng.randint(leaders, 4)))
+            assignments = list(course.valid_assignments())
+            domains = [list(d) for d in course.domains]
+            cant = [set(c) for c in course.cant]
+            changed = True
+            while changed:
+                changed, clash = presolve.reduce_domains(domains, cant, course.leaders, len(course.ints_to_domains))
+                if clash is not None:
+                    self.assertEqual(assignments, [])
+                    break
+            for sections in assignments:
+                for i, t in enumerate(sections):
+                    self.assertTrue(t in domains[i])
+                    # the order of what is left is kept
+                    self.assertEqual(domains[i], [u for u in course.domains[i] if u in domains[i]])
+
+    def test_presolve_only_gives_up_without_assignments(self):
+        rng = random.Random(7)
+        for trial in range(200):
+            leaders = rng.randint(1, 3)
+            course = Course(random_course(rng, leaders, rng.randint(0, 5), rng.randint(1, 4)))
+            try:
+                course.presolved()
+            except presolve.Infeasible:
+                self.assertEqual(list(course.valid_assignments()), [])
+
+    def test_reasons(self):
+        data = {
+            'ta1' : {'is_ta' : True, 'is_male' : True, 'section_availability_ordered' : ['a', 'b'], 'cant_be_with' : []},
+            'ta2' : {'is_ta' : True, 'is_male' : True, 'section_availability_ordered' : ['a', 'b'], 'cant_be_with' : []},
+            'ta3' : {'is_ta' : True, 'is_male' : True, 'section_availability_ordered' : ['b', 'a'], 'cant_be_with' : []},
+            }
+        for i in range(3):
+            data['s%d' % i] = {'is_ta' : False, 'is_male' : True, 'section_availability_ordered' : ['a', 'b'], 'cant_be_with' : []}
+        with self.assertRaises(presolve.Infeasible) as raised:
+            Course(data).presolved()
+        self.assertEqual(raised.exception.reasons, ['ta1, ta2 and ta3 can only lead a and b between them'])
+
+        data['s0']['section_availability_ordered'] = ['c']
+        with self.assertRaises(presolve.Infeasible) as raised:
+            Course(data).presolved()
+        self.assertEqual(raised.exception.reasons, ['s0 has no section they can attend'])
+
+class EncodingTest(TestCase):
+    def test_no_leaders(self):
+        # Without leaders there are no sections and nobody gets one
+        data = random_course(random.Random(15), 1, 4, 3)
+        del data['leader0']
+        (X, ints_to_domains, leader_count, genders, domain_offsets, domain_values,
+         constraint_offsets, constraint_values) = generate_availability_problem(data)
+        self.assertEqual((leader_count, ints_to_domains), (0, []))
+        self.assertEqual(list(domain_offsets), [0] * 5)
+        self.assertEqual(list(domain_values), [])
+        self.assertEqual(assign_students.assign_students(data, 1),
+                         dict((name, 'NO ASSIGNMENT') for name in data))
+
+    def test_leader_cant_be_with(self):
+        # A leader who cannot be with a student is a restriction of the
+        # student, just as if the student had asked
+        data = {
+            'ta1' : {'is_ta' : True, 'is_male' : True, 'section_availability_ordered' : ['a'], 'cant_be_with' : ['s1']},
+            'ta2' : {'is_ta' : True, 'is_male' : False, 'section_availability_ordered' : ['b'], 'cant_be_with' : []},
+            's1' : {'is_ta' : False, 'is_male' : True, 'section_availability_ordered' : ['a', 'b'], 'cant_be_with' : []},
+            's2' : {'is_ta' : False, 'is_male' : True, 'section_availability_ordered' : ['a', 'b'], 'cant_be_with' : ['ta2']},
+            }
+        course = Course(data)
+        name = dict((n, i) for i, n in enumerate(course.X))
+        self.assertEqual(course.cant[name['s1']], [name['ta1']])
+        self.assertEqual(course.cant[name['s2']], [name['ta2']])
+        self.assertEqual(course.cant[name['ta1']], [])
+        named = [dict((n, course.ints_to_domains[t]) for n, t in zip(course.X, sections))
+                 for sections in course.valid_assignments()]
+        self.assertEqual(named, [{'ta1' : 'a', 'ta2' : 'b', 's1' : 'b', 's2' : 'a'}])
+
+class RepairTest(TestCase):
+    # Repairing an earlier assignment with every search flag
+    def test_repair_with_backjumping(self):
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        rng = random.Random(1)
+        for flags in (assign_students.BACKJUMPING, assign_students.BACKJUMPING | assign_students.NOGOOD_LEARNING,
+                      assign_students.MRV_ORDERING | assign_students.FORWARD_CHECKING | assign_students.BRANCH_AND_BOUND |
+                      assign_students.BACKJUMPING | assign_students.NOGOOD_LEARNING):
+            for trial in range(30):
+                data = random_course(rng, rng.randint(1, 3), rng.randint(3, 5), rng.randint(3, 4))
+                try:
+                    previous = assign_students.assign_students(data, 1, flags, threads=1)
+                except assign_students.Infeasible:
+                    continue
+                # a student can no longer be with their leader, who keeps
+                # their section in the repair
+                name = 'student%d' % rng.randrange(3)
+                leader = [other for other in data if data[other]['is_ta'] and previous[other] == previous[name]][0]
+                changed = dict(data)
+                changed[name] = dict(data[name], cant_be_with=[leader])
+                course = Course(changed)
+                try:
+                    result = assign_students.assign_students(changed, 1, flags, threads=1, previous=previous)
+                except assign_students.Infeasible:
+                    continue
+                sections = course.sections(result)
+                if -1 in sections:
+                    self.assertEqual(list(course.valid_assignments()), [])
+                else:
+                    self.assertTrue(course.is_valid(sections))
+
+    def test_repair_must_beat_hint(self):
+        # A valid hint does not make a repair that cannot improve on it
+        # count as done, so the worst assignment given as both the hint and
+        # the assignment to repair is improved on
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        for data, course, worst, cost in worst_assignments(random.Random(2), 2, 5, 3, 10):
+            previous = assign_students.student_to_section_from_result(worst, course.X, course.ints_to_domains)
+            result = assign_students.assign_students(data, 1, assign_students.MRV_ORDERING | assign_students.BRANCH_AND_BOUND,
+                                                     threads=1, previous=previous, hint=previous)
+            self.assertLess(course.cost(course.sections(result)), cost)
+
+class HintTest(TestCase):
+    def test_hint_goes_before_least_loaded(self):
+        # Stopping at the first solution, a valid hint is found again even
+        # though it is the worst assignment and LEAST_LOADED would steer
+        # the students elsewhere
+        if assign_students.c_solver() is None:
+            self.skipTest('libbt.so has not been built')
+        for data, course, worst, cost in worst_assignments(random.Random(3), 2, 6, 3, 10):
+            hint = assign_students.student_to_section_from_result(worst, course.X, course.ints_to_domains)
+            result = assign_students.assign_students(data, 1, assign_students.LEAST_LOADED | assign_students.LOCAL_SEARCH,
+                                                     threads=1, hint=hint)
+            self.assertEqual(course.sections(result), worst)
+
+class SyncResult(object):
+    # A solve run in this process when the test says so
+    def __init__(self, func, args, callback):
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.done = False
+
+    def run(self):
+        self.callback(self.func(*self.args))
+        self.done = True
+
+    def ready(self):
+        return self.done
+
+    def successful(self):
+        return True
+
+class SyncPool(object):
+    # Stands in for the worker pool, running each solve as soon as it is
+    # submitted unless defer is set, in which case run_all runs them
+    def __init__(self):
+        self.defer = False
+        self.results = []
+
+    def apply_async(self, func, args, callback):
+        result = SyncResult(func, args, callback)
+        self.results.append(result)
+        if not self.defer:
+            result.run()
+        return result
+
+    def run_all(self):
+        for result in self.results:
+            if not result.done:
+                result.run()
+
+JOB_COURSE = {
+    'ta1' : {'is_ta' : True, 'is_male' : True, 'section_availability_ordered' : ['a'], 'cant_be_with' : []},
+    's1' : {'is_ta' : False, 'is_male' : False, 'section_availability_ordered' : ['a'], 'cant_be_with' : []},
+    }
+
+class JobTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        jobs._pending.clear()
+        self.pool = SyncPool()
+        self.saved = jobs.pool, jobs.solve
+        jobs.pool = lambda: self.pool
+        self.solved = []
+        def solve(data, max_time, flags, weights, previous):
+            self.solved.append(previous)
+            return dict((name, 'a') for name in data)
+        jobs.solve = solve
+
+    def tearDown(self):
+        jobs.pool, jobs.solve = self.saved
+        jobs._pending.clear()
+        cache.clear()
+
+    def test_pending_job_is_kept(self):
+        self.pool.defer = True
+        job_id = jobs.submit('c1', JOB_COURSE)
+        self.assertEqual(jobs.get_job(job_id).status(), jobs.PENDING)
+        self.assertEqual(jobs.submit('c1', JOB_COURSE), job_id)
+        self.pool.run_all()
+        self.assertEqual(jobs.get_job(job_id).as_dict()['assignments'], {'ta1' : 'a', 's1' : 'a'})
+        self.assertEqual(len(self.solved), 1)
+
+    def test_cache_hit(self):
+        # another course with the same availabilities is done straight away
+        jobs.submit('c1', JOB_COURSE)
+        job = jobs.get_job(jobs.submit('c2', JOB_COURSE))
+        self.assertEqual(job.status(), jobs.DONE)
+        self.assertEqual(job.result(), {'ta1' : 'a', 's1' : 'a'})
+        self.assertEqual(len(self.solved), 1)
+
+    def test_repair_is_not_cached(self):
+        # a repair depends on the assignment it started from, so another
+        # course with the same availabilities is solved from scratch
+        changed = dict(JOB_COURSE, s2=JOB_COURSE['s1'])
+        jobs.submit('c1', JOB_COURSE)
+        jobs.submit('c1', changed)
+        self.assertEqual(self.solved, [None, {'ta1' : 'a', 's1' : 'a'}])
+        self.assertEqual(jobs.get_job(jobs.submit('c2', changed)).status(), jobs.DONE)
+        self.assertEqual(self.solved, [None, {'ta1' : 'a', 's1' : 'a'}, None])
+
+    def test_queue_full(self):
+        self.pool.defer = True
+        size = jobs.SOLVER_QUEUE_SIZE
+        jobs.SOLVER_QUEUE_SIZE = 1
+        try:
+            jobs.submit('c1', JOB_COURSE)
+            self.assertRaises(jobs.QueueFull, jobs.submit, 'c2', dict(JOB_COURSE, s2=JOB_COURSE['s1']))
+            # a finished solve frees its place
+            self.pool.run_all()
+            jobs.submit('c2', dict(JOB_COURSE, s2=JOB_COURSE['s1']))
+        finally:
+            jobs.SOLVER_QUEUE_SIZE = size
+
+    def test_lost_solve(self):
+        # a solve that is not back by its deadline fails and frees its place
+        self.pool.defer = True
+        job_id = jobs.submit('c1', JOB_COURSE)
+        result, deadline = jobs._pending[job_id]
+        jobs._pending[job_id] = (result, 0)
+        job = jobs.get_job(job_id)
+        self.assertEqual((job.status(), job.as_dict()['error']), (jobs.FAILED, 'the solve was lost'))
+        self.assertEqual(jobs._pending, {})
+
+    def test_infeasible(self):
+        jobs.solve = self.saved[1]
+        data = dict(JOB_COURSE, s2={'is_ta' : False, 'is_male' : True, 'section_availability_ordered' : ['b'], 'cant_be_with' : []})
+        data = jobs.get_job(jobs.submit('c1', data)).as_dict()
+        self.assertEqual((data['status'], data['error']), (jobs.FAILED, 'infeasible'))
+        self.assertEqual(data['reasons'], ['s2 has no section they can attend'])
+
+    def test_status_view(self):
+        try:
+            import views
+        except ImportError:
+            self.skipTest('the views need pycrypto')
+        def status(course_id, job_id=None):
+            request = RequestFactory().get('/assignment/%s/status' % course_id, {'job' : job_id} if job_id else {})
+            request.user = User(username='someone')
+            return views.assignment_status(request, course_id)
+        self.assertEqual(status('c1').status_code, 404)
+        job_id = jobs.submit('c1', JOB_COURSE)
+        response = status('c1', job_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['assignments'], {'ta1' : 'a', 's1' : 'a'})
+        self.assertEqual(json.loads(status('c1').content)['job_id'], job_id)
+        # a job is only shown for its own course
+        self.assertEqual(status('c2', job_id).status_code, 404)
@@ -16,7 +16,7 @@ import urllib
 import mysite.settings
 import dnd
 
-from backend import assign_students
+import jobs
 
 # HELPERS
 
@@ -57,9 +57,39 @@ def assignment(request, course_id):
     if not user_info['dept'] == 'Computer Science':
         return HttpResponse('you must be a prof in order to see this')
     '''
+    action = request.get_full_path().split('?')[0]
+
+    # SHOW THE LATEST JOB AND A BUTTON TO START ONE
+    if request.method != 'POST':
+        job = jobs.course_job(course_id)
+        data = {
+            'course_id' : course_id,
+            'job_id' : job.job_id if job is not None else None,
+            'status' : action + '/status',
+            'action' : action,
+            }
+        return render_to_response('assignment.html', data)
+
+    # solving takes a while so hand it to a worker and send them to
+    # the status page of its job to wait for it
     dict_availabilities = availabilities_as_dict(course_id)
-    assignments = assign_students.assign_students(dict_availabilities)
-    return HttpResponse(pprint.pformat(assignments))
+    try:
+        job_id = jobs.submit(course_id, dict_availabilities)
+    except jobs.QueueFull:
+        return HttpResponse('too many assignments are being worked out, try again in a minute', status=503)
+    redirect_url = action + '/status?' + urllib.urlencode({'job' : job_id})
+    return HttpResponseRedirect(redirect_url)
+
+@login_required
+def assignment_status(request, course_id):
+    # the latest job for the course unless a job id is given
+    if request.GET.get('job', False):
+        job = jobs.get_job(request.GET['job'])
+    else:
+        job = jobs.course_job(course_id)
+    if job is None or job.course_id != course_id:
+        return HttpResponse('no assignment has been started for this course', status=404)
+    return HttpResponse(json.dumps(job.as_dict()), content_type='application/json')
 
 
 @login_required
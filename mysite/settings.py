@@ -129,6 +129,26 @@ INSTALLED_APPS = (
      'mysite.mainapp',
 )
 
+# SOLVER JOBS (see mainapp/jobs.py)
+# jobs are kept in the cache, so with more than one server process CACHES
+# has to be shared between them, e.g. memcached or
+# CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/var/tmp/sectionscheduler'}}
+
+# worker processes that run solves, None for one per core
+SOLVER_PROCESSES = None
+# how many solves each server process can have waiting or running at once
+SOLVER_QUEUE_SIZE = 16
+# seconds each solve is given
+SOLVER_TIME_BUDGET = 30
+# search flags to solve with (see backend/assign_students.py), None for the defaults
+SOLVER_FLAGS = None
+# weights of the 'size', 'gender' and 'preference' cost terms, None for the defaults
+SOLVER_WEIGHTS = None
+# seconds spent improving an earlier assignment repaired after a change
+SOLVER_REPAIR_IMPROVE_TIME = 1
+# seconds a solved assignment is kept in the cache for the same availabilities
+SOLVER_CACHE_SECONDS = 60 * 60 * 24 * 7
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error.